@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Latency of VPK.get_file(...).read() with and without the content cache,
+using a Zipfian access pattern over many small files
+"""
+
+from __future__ import print_function
+import argparse
+import bisect
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import vpk
+
+
+def make_pak(workdir, num_files, file_size):
+    srcdir = os.path.join(workdir, 'src')
+    rnd = random.Random(0)
+
+    for i in range(num_files):
+        dirname = os.path.join(srcdir, 'materials', 'dir%02d' % (i % 50))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        with open(os.path.join(dirname, 'file%05d.vmt' % i), 'wb') as f:
+            f.write(bytearray(rnd.getrandbits(8) for _ in range(rnd.randint(1, file_size))))
+
+    pak_path = os.path.join(workdir, 'bench_dir.vpk')
+    vpk.new(srcdir).save(pak_path)
+    return pak_path
+
+
+def zipf_sampler(population, s, seed=0):
+    weights = [1.0 / (rank ** s) for rank in range(1, len(population) + 1)]
+    total = sum(weights)
+    cumulative = []
+    acc = 0.0
+    for w in weights:
+        acc += w / total
+        cumulative.append(acc)
+
+    rnd = random.Random(seed)
+    shuffled = list(population)
+    rnd.shuffle(shuffled)
+
+    def sample():
+        return shuffled[min(bisect.bisect(cumulative, rnd.random()), len(shuffled) - 1)]
+
+    return sample
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100.0), len(values) - 1)]
+
+
+def run(pak, paths, requests, s):
+    sample = zipf_sampler(paths, s)
+    clock = timeit.default_timer
+    latencies = []
+
+    for _ in range(requests):
+        path = sample()
+        start = clock()
+        with pak.get_file(path) as f:
+            f.read()
+        latencies.append(clock() - start)
+
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--files', type=int, default=5000)
+    parser.add_argument('--file-size', type=int, default=4096, help='Max file size')
+    parser.add_argument('--requests', type=int, default=50000)
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent')
+    parser.add_argument('--cache-size', type=int, default=8*2**20, help='Cache size in bytes')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='vpk-bench-')
+
+    try:
+        pak_path = make_pak(workdir, args.files, args.file_size)
+        paths = list(vpk.open(pak_path))
+
+        for label, kwargs in (('no cache', {}),
+                              ('cache', {'cache_size': args.cache_size}),
+                              ):
+            pak = vpk.open(pak_path, **kwargs)
+            pak.read_index()
+            latencies = run(pak, paths, args.requests, args.zipf)
+
+            print("%-10s p50: %7.1fus  p99: %7.1fus  total: %.2fs" % (
+                label,
+                percentile(latencies, 50) * 1e6,
+                percentile(latencies, 99) * 1e6,
+                sum(latencies),
+                ))
+
+            if pak.cache is not None:
+                print("%-10s %s" % ('', pak.cache.stats()))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
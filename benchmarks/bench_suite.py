@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the hot paths on a synthetic multi archive VPK.
+Each benchmark runs in a freshly spawned process, reporting ops/s, MB/s and peak RSS,
+optionally compared against a baseline saved from an earlier run.
+"""
+
+from __future__ import print_function, division
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import timeit
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import vpk
+from synthetic import make_vpk
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    """
+    Registers a benchmark. It does its setup and returns a function doing
+    the measured work, which returns (ops, bytes)
+    """
+    BENCHMARKS[func.__name__[len('bench_'):]] = func
+    return func
+
+
+def sample_paths(ctx, count):
+    rnd = random.Random(1)
+    return [rnd.choice(ctx['paths']) for _ in range(count)]
+
+
+@benchmark
+def bench_index_parse(ctx):
+    pak = vpk.open(ctx['pak_path'])
+
+    def run():
+        pak.read_index()
+        return len(pak.tree), pak.tree_length
+    return run
+
+
+@benchmark
+def bench_lookup(ctx):
+    pak = vpk.open(ctx['pak_path'], read_header_only=False)
+    paths = sample_paths(ctx, ctx['ops'])
+
+    def run():
+        for path in paths:
+            pak.get_file_meta(path)
+        return len(paths), 0
+    return run
+
+
+@benchmark
+def bench_random_read(ctx):
+    pak = vpk.open(ctx['pak_path'], read_header_only=False)
+    paths = sample_paths(ctx, ctx['ops'])
+
+    def run():
+        total = 0
+        for path in paths:
+            with pak.get_file(path) as f:
+                total += len(f.read())
+        return len(paths), total
+    return run
+
+
+@benchmark
+def bench_sequential_read(ctx):
+    pak = vpk.open(ctx['pak_path'])
+
+    def run():
+        total = 0
+        entries = pak.read_index_sorted()
+        for path, metadata in entries:
+            with pak.get_vpkfile_instance(path, metadata) as f:
+                for chunk in iter(lambda: f.read(2**16), b''):
+                    total += len(chunk)
+        return len(entries), total
+    return run
+
+
+def extract(pak, out_dir):
+    total = 0
+    entries = pak.read_index_sorted()
+
+    for path, metadata in entries:
+        out_path = os.path.join(out_dir, path)
+        dirname = os.path.dirname(out_path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        with pak.get_vpkfile_instance(path, metadata) as f:
+            f.save(out_path)
+            total += f.length
+
+    return len(entries), total
+
+
+@benchmark
+def bench_extract(ctx):
+    pak = vpk.open(ctx['pak_path'])
+    out_dir = os.path.join(ctx['workdir'], 'extract')
+
+    def run():
+        try:
+            return extract(pak, out_dir)
+        finally:
+            shutil.rmtree(out_dir)
+    return run
+
+
+@benchmark
+def bench_verify(ctx):
+    pak = vpk.open(ctx['pak_path'])
+
+    def run():
+        if pak.verify_entries(workers=ctx['workers']):
+            raise RuntimeError("Verification failed")
+        return len(ctx['paths']), ctx['total_bytes']
+    return run
+
+
+@benchmark
+def bench_create(ctx):
+    src_dir = os.path.join(ctx['workdir'], 'create_src')
+    out_path = os.path.join(ctx['workdir'], 'created.vpk')
+
+    if not os.path.isdir(src_dir):
+        extract(vpk.open(ctx['pak_path']), src_dir)
+
+    def run():
+        newpak = vpk.new(src_dir)
+        newpak.save(out_path)
+        return newpak.file_count, os.path.getsize(out_path)
+    return run
+
+
+@benchmark
+def bench_checksums(ctx):
+    # checksums only cover the _dir.vpk, so use one with embedded data
+    pak_path = os.path.join(ctx['workdir'], 'embedded.vpk')
+
+    if not os.path.exists(pak_path):
+        make_vpk(pak_path, archives=0, **ctx['config'])
+
+    pak = vpk.open(pak_path)
+
+    def run():
+        pak.calculate_checksums()
+        return 1, pak.checksum_stats['bytes']
+    return run
+
+
+def peak_rss_mb():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_benchmark(task):
+    name, ctx = task
+    run = BENCHMARKS[name](ctx)
+
+    start = timeit.default_timer()
+    ops, nbytes = run()
+    seconds = timeit.default_timer() - start
+
+    return {'seconds': seconds,
+            'ops': ops,
+            'bytes': nbytes,
+            'ops_per_sec': ops / seconds,
+            'mb_per_sec': nbytes / seconds / 2**20,
+            'peak_rss_mb': peak_rss_mb(),
+            }
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints change of throughput against the baseline, returns list of regressed benchmarks
+    """
+    regressed = []
+
+    print("\n%-16s %12s %12s %8s" % ("Benchmark", "Baseline", "Current", "Change"))
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        before = baseline[name]['ops_per_sec']
+        after = result['ops_per_sec']
+        change = (after - before) / before * 100
+
+        if change < -threshold:
+            regressed.append(name)
+
+        print("%-16s %12s %12s %+7.1f%%%s" % (
+              name,
+              "{:,.0f}".format(before),
+              "{:,.0f}".format(after),
+              change,
+              "  REGRESSION" if name in regressed else "",
+              ))
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('benchmarks', nargs='*', metavar='NAME', help='Benchmarks to run (default: all)')
+    parser.add_argument('--list', action='store_true', help='List benchmarks')
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--mean-size', type=int, default=8192, help='Mean file size')
+    parser.add_argument('--max-size', type=int, default=2**20, help='Max file size')
+    parser.add_argument('--size-dist', default='lognormal', choices=('lognormal', 'uniform', 'fixed'))
+    parser.add_argument('--depth', type=int, default=3, help='Max directory depth')
+    parser.add_argument('--archives', type=int, default=4)
+    parser.add_argument('--preload', type=int, default=0, help='Preload bytes per file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ops', type=int, default=20000, help='Operations for lookup and random read')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Workers for verify')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark, best is reported')
+    parser.add_argument('--save', metavar='FILE', help='Save results as JSON baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare against JSON baseline')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percent of ops/s lost to count as regression (default: 10)')
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return
+
+    names = args.benchmarks or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark: %s" % name)
+
+    config = {'files': args.files,
+              'mean_size': args.mean_size,
+              'max_size': args.max_size,
+              'distribution': args.size_dist,
+              'depth': args.depth,
+              'preload': args.preload,
+              'seed': args.seed,
+              }
+
+    workdir = tempfile.mkdtemp(prefix='vpk-bench-')
+
+    try:
+        pak_path = os.path.join(workdir, 'bench_dir.vpk')
+        paths = make_vpk(pak_path, archives=args.archives, **config)
+        pak = vpk.open(pak_path)
+
+        ctx = {'workdir': workdir,
+               'pak_path': pak_path,
+               'paths': paths,
+               'total_bytes': sum(metadata[2] + metadata[5] for _, metadata in pak.items()),
+               'config': config,
+               'ops': args.ops,
+               'workers': args.workers,
+               }
+
+        print("%d files, %.1f MB in %d archives, index %.1f KB" % (
+              len(paths), ctx['total_bytes'] / 2**20, args.archives, pak.tree_length / 2**10))
+        print("\n%-16s %12s %10s %10s %10s" % ("Benchmark", "ops/s", "MB/s", "Seconds", "Peak RSS"))
+
+        results = OrderedDict()
+
+        for name in names:
+            runs = []
+            for _ in range(args.repeat):
+                # fresh spawned process for every run. A forked one would start with
+                # this process's memory, and report that as its peak RSS
+                pool = multiprocessing.get_context('spawn').Pool(1)
+                try:
+                    runs.append(pool.apply(run_benchmark, ((name, ctx),)))
+                finally:
+                    pool.terminate()
+
+            result = results[name] = min(runs, key=lambda result: result['seconds'])
+
+            print("%-16s %12s %10.1f %10.3f %8.1fMB" % (
+                  name,
+                  "{:,.0f}".format(result['ops_per_sec']),
+                  result['mb_per_sec'],
+                  result['seconds'],
+                  result['peak_rss_mb'],
+                  ))
+    finally:
+        shutil.rmtree(workdir)
+
+    config['archives'] = args.archives
+    config['ops'] = args.ops
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        if baseline['config'] != config:
+            print("\nWarning: baseline was made with different options: %s" % baseline['config'])
+
+        if compare(results, baseline['results'], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Generator of synthetic, reproducible VPKs for benchmarks
+
+Unlike ``vpk.new(...).save(...)``, which only writes single file VPKs,
+this writes the data split over numbered archives, like the game VPKs.
+"""
+
+from __future__ import division
+import math
+import os
+import random
+import struct
+import sys
+from binascii import crc32
+from hashlib import md5
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from vpk import _make_archive_path
+
+EXTENSIONS = ('vmt', 'vtf', 'mdl', 'wav', 'txt', 'pcf')
+
+
+def file_sizes(count, mean_size, max_size, distribution='lognormal', seed=0):
+    """
+    Returns a list of count file sizes, no larger than max_size
+    """
+    rnd = random.Random(seed)
+
+    if distribution == 'fixed':
+        return [min(mean_size, max_size)] * count
+    if distribution == 'uniform':
+        return [rnd.randint(0, min(2 * mean_size, max_size)) for _ in range(count)]
+    if distribution == 'lognormal':
+        # sigma=1 gives the long tail of a few large files seen in game VPKs
+        mu = math.log(max(mean_size, 1)) - 0.5
+        return [min(int(rnd.lognormvariate(mu, 1.0)), max_size) for _ in range(count)]
+
+    raise ValueError("Unknown size distribution: %s" % repr(distribution))
+
+
+def make_vpk(vpk_path, files=10000, mean_size=4096, max_size=2**20, distribution='lognormal',
+             depth=3, archives=4, preload=0, seed=0):
+    """
+    Writes a version 2 VPK at vpk_path, with the file data split over the
+    given number of archives, or embedded in the _dir.vpk when archives is 0.
+    The first ``preload`` bytes of every file are stored in the index.
+
+    Returns the list of file paths in the VPK
+    """
+    if archives > 0 and not vpk_path.endswith('_dir.vpk'):
+        raise ValueError("VPK path with archives should end in _dir.vpk")
+
+    rnd = random.Random(seed)
+    sizes = file_sizes(files, mean_size, max_size, distribution, seed)
+
+    # file contents are slices of a block of random data
+    block = bytes(bytearray(rnd.getrandbits(8) for _ in range(2**16)))
+    pool = block * (max_size // len(block) + 2)
+
+    tree = {}
+    paths = []
+    offsets = {}
+    data_order = []
+
+    for i, size in enumerate(sizes):
+        ext = EXTENSIONS[i % len(EXTENSIONS)]
+        dirname = '/'.join('dir%d' % rnd.randrange(16) for _ in range(rnd.randint(1, depth))) if depth else ' '
+        filename = 'file%06d' % i
+        start = rnd.randrange(len(block))
+        data = pool[start:start + size]
+
+        preload_length = min(preload, size)
+        archive_index = i * archives // files if archives > 0 else 0x7fff
+        archive_offset = offsets.get(archive_index, 0)
+        offsets[archive_index] = archive_offset + size - preload_length
+
+        tree.setdefault(ext, {}).setdefault(dirname, []).append((filename,
+                                                                  crc32(data) & 0xffffffff,
+                                                                  data[:preload_length],
+                                                                  archive_index,
+                                                                  archive_offset,
+                                                                  size - preload_length,
+                                                                  ))
+        data_order.append((archive_index, start + preload_length, size - preload_length))
+        paths.append("%s/%s.%s" % (dirname, filename, ext) if depth else "%s.%s" % (filename, ext))
+
+    index = []
+    for ext in sorted(tree):
+        index.append(ext.encode('utf-8') + b'\x00')
+        for dirname in sorted(tree[ext]):
+            index.append(dirname.encode('utf-8') + b'\x00')
+            for filename, crc, preload_data, archive_index, archive_offset, file_length in tree[ext][dirname]:
+                index.append(filename.encode('utf-8') + b'\x00')
+                index.append(struct.pack("IHHIIH", crc, len(preload_data), archive_index,
+                                         archive_offset, file_length, 0xffff))
+                index.append(preload_data)
+            index.append(b'\x00')
+        index.append(b'\x00')
+    index.append(b'\x00')
+    index = b''.join(index)
+
+    embed_chunk_length = offsets.get(0x7fff, 0)
+    header = struct.pack("7I", 0x55aa1234, 2, len(index), embed_chunk_length, 0, 48, 0)
+
+    tree_checksum = md5(index)
+    chunk_hashes_checksum = md5()
+    file_checksum = md5(header)
+    file_checksum.update(index)
+
+    handles = {}
+    try:
+        with open(vpk_path, 'wb') as f:
+            f.write(header)
+            f.write(index)
+            handles[0x7fff] = f
+
+            for archive_index, start, length in data_order:
+                if archive_index not in handles:
+                    handles[archive_index] = open(_make_archive_path(vpk_path, archive_index), 'wb')
+
+                handles[archive_index].write(pool[start:start + length])
+
+                if archive_index == 0x7fff:
+                    file_checksum.update(pool[start:start + length])
+
+            file_checksum.update(tree_checksum.digest())
+            file_checksum.update(chunk_hashes_checksum.digest())
+
+            f.write(tree_checksum.digest())
+            f.write(chunk_hashes_checksum.digest())
+            f.write(file_checksum.digest())
+    finally:
+        for archive_index, f in handles.items():
+            if archive_index != 0x7fff:
+                f.close()
+
+    return paths
@@ -1,14 +1,30 @@
 #!/usr/bin/env python
 
 from setuptools import setup
+from setuptools.command.build_py import build_py
 from codecs import open
 from os import path
+import sys
 import vpk
 
 here = path.abspath(path.dirname(__file__))
 with open(path.join(here, 'README.rst'), encoding='utf-8') as f:
     long_description = f.read()
 
+
+class build_py_compat(build_py):
+    """
+    Leaves out vpk.aio on Pythons older than 3.6, which can't compile it
+    """
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+
+        if sys.version_info < (3, 6):
+            modules = [module for module in modules if module[:2] != ('vpk', 'aio')]
+
+        return modules
+
+
 setup(
     name='vpk',
     version=vpk.__version__,
@@ -36,7 +52,11 @@ setup(
     ],
     keywords='valve pak vpk tf2 dota2 csgo dota',
     packages=['vpk'],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     zip_safe=True,
+    cmdclass={'build_py': build_py_compat},
     entry_points={
         'console_scripts': [
             'vpk = vpk.cli:main',
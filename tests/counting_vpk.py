@@ -0,0 +1,17 @@
+"""
+VPK counting index passes and opened files, for tests of work being skipped
+"""
+import vpk
+
+
+class CountingVPK(vpk.VPK):
+    index_reads = 0
+    file_opens = 0
+
+    def read_index_iter(self):
+        self.index_reads += 1
+        return super(CountingVPK, self).read_index_iter()
+
+    def get_vpkfile_instance(self, *args, **kwargs):
+        self.file_opens += 1
+        return super(CountingVPK, self).get_vpkfile_instance(*args, **kwargs)
@@ -0,0 +1,94 @@
+"""
+Local HTTP server with Range support, standing in for remote storage in tests
+"""
+import os
+import re
+import threading
+
+try:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def translate_path(self, path):
+        return os.path.join(self.server.root, path.split('?', 1)[0].lstrip('/'))
+
+    def send_head(self):
+        self.server.requests.append((self.command, self.path, self.headers.get('Range')))
+        path = self.translate_path(self.path)
+
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+
+        size = os.path.getsize(path)
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+
+        if not match:
+            self.send_response(200)
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            return open(path, 'rb')
+
+        start = int(match.group(1))
+        end = min(int(match.group(2) or size - 1), size - 1)
+
+        if start >= size:
+            self.send_error(416)
+            return None
+
+        f = open(path, 'rb')
+        f.seek(start)
+        self.body = f.read(end - start + 1)
+        f.close()
+
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, size))
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        return None
+
+    def do_GET(self):
+        self.body = None
+        f = self.send_head()
+
+        if f is not None:
+            try:
+                self.wfile.write(f.read())
+            finally:
+                f.close()
+        elif self.body is not None:
+            self.wfile.write(self.body)
+
+    def do_HEAD(self):
+        f = self.send_head()
+        if f is not None:
+            f.close()
+
+
+class RangeServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), RangeRequestHandler)
+        self.root = root
+        self.requests = []
+        self.url = 'http://127.0.0.1:%d/' % self.server_address[1]
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
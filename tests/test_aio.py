@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import vpk
+
+try:
+    import asyncio
+    from vpk import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+
+def collect(run, agen):
+    chunks = []
+    while True:
+        try:
+            chunks.append(run(agen.__anext__()))
+        except StopAsyncIteration:
+            return chunks
+
+
+@unittest.skipIf(aio is None, "asyncio interface requires Python 3.6+")
+class testcase_aio(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.run = self.loop.run_until_complete
+        self.pak = vpk.open('./tests/test_dir.vpk')
+        self.apak = aio.open('./tests/test_dir.vpk', max_workers=2, max_concurrency=2)
+
+    def tearDown(self):
+        self.apak.close()
+        self.loop.close()
+
+    def test_read(self):
+        for path in self.pak:
+            self.assertEqual(self.run(self.apak.read(path)), self.pak[path].read())
+
+    def test_read_many(self):
+        paths = list(self.pak) * 10
+        expected = [self.pak[path].read() for path in paths]
+        self.assertEqual(self.run(self.apak.read_many(paths)), expected)
+
+    def test_stream(self):
+        # testfile2.txt has preload data and archive data
+        path = "testdir/testfile2.txt"
+        chunks = collect(self.run, self.apak.stream(path, 10))
+        self.assertTrue(all(len(chunk) <= 10 for chunk in chunks))
+        self.assertEqual(b''.join(chunks), self.pak[path].read())
+
+    def test_missing_path(self):
+        with self.assertRaises(KeyError):
+            self.run(self.apak.read("missing.txt"))
+
+    def test_truncated_archive(self):
+        temp = tempfile.mkdtemp()
+        try:
+            for name in ('test_dir.vpk', 'test_001.vpk', 'test_099.vpk'):
+                shutil.copy(os.path.join('./tests', name), temp)
+
+            path = "testfile1.txt"
+            archive_path = self.pak._make_vpkfile_path(self.pak.get_file_meta(path))
+            with open(os.path.join(temp, os.path.basename(archive_path)), 'r+b') as f:
+                f.truncate(10)
+
+            apak = aio.open(os.path.join(temp, 'test_dir.vpk'))
+            try:
+                with self.assertRaises(IOError):
+                    self.run(apak.read(path))
+                with self.assertRaises(IOError):
+                    collect(self.run, apak.stream(path))
+            finally:
+                apak.close()
+        finally:
+            shutil.rmtree(temp)
+
+    def test_context_manager(self):
+        # no async syntax here, so the module still imports on Python 2
+        apak = self.run(aio.open('./tests/test_dir.vpk').__aenter__())
+        try:
+            self.assertEqual(self.run(apak.read("testfile1.txt")), self.pak["testfile1.txt"].read())
+        finally:
+            self.run(apak.__aexit__(None, None, None))
+
+        self.assertTrue(apak._executor._shutdown)
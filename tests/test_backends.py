@@ -0,0 +1,59 @@
+import unittest
+
+import vpk
+from vpk.backends import BlockCache, HTTPBackend, LocalBackend
+
+from tests.range_server import RangeServer
+
+
+class testcase_backends(unittest.TestCase):
+    def setUp(self):
+        self.pak = vpk.open('./tests/test_dir.vpk')
+        self.expected = dict((path, self.pak[path].read()) for path in self.pak)
+
+    def check_pak(self, pak):
+        self.assertEqual(sorted(pak), sorted(self.expected))
+        for path, data in self.expected.items():
+            with pak[path] as f:
+                self.assertEqual(f.read(), data)
+                self.assertTrue(f.verify())
+
+    def test_local(self):
+        backend = LocalBackend('./tests')
+        self.check_pak(vpk.open('test_dir.vpk', fopen=backend.open))
+
+    def test_block_cache(self):
+        backend = BlockCache(LocalBackend('./tests'), block_size=64, max_blocks=4, readahead=2)
+        self.check_pak(vpk.open('test_dir.vpk', fopen=backend.open))
+        self.assertTrue(backend.hits > 0)
+
+        f = backend.open('test_001.vpk')
+        f.seek(100)
+        self.assertEqual(f.read(50), self.expected['testfile1.txt'][100:150])
+        self.assertEqual(f.read(), self.expected['testfile1.txt'][150:])
+        self.assertEqual(f.read(10), b'')
+
+    def test_block_cache_limit(self):
+        backend = BlockCache(LocalBackend('./tests'), block_size=16, max_blocks=2, readahead=2)
+
+        self.assertEqual(backend.read_range('test_001.vpk', 0, 216), self.expected['testfile1.txt'])
+        self.assertEqual(len(backend._blocks), 2)
+        self.assertEqual(backend.misses, 14)
+
+    def test_http(self):
+        with RangeServer('./tests') as server:
+            backend = HTTPBackend(server.url)
+            self.check_pak(vpk.open('test_dir.vpk', fopen=backend.open))
+            self.assertEqual(backend.read_range('test_001.vpk', 1000, 10), b'')
+
+    def test_http_block_cache_requests(self):
+        with RangeServer('./tests') as server:
+            http = HTTPBackend(server.url)
+            backend = BlockCache(http, block_size=2**16)
+            pak = vpk.open('test_dir.vpk', fopen=backend.open)
+            pak.read_index()
+            self.check_pak(pak)
+
+            # one request per file: dir, 001 and 099
+            self.assertEqual(http.requests, 3)
+            self.assertEqual(len(server.requests), 3)
@@ -1,12 +1,19 @@
+import json
+import os
+import shutil
 import sys
+import tarfile
+import tempfile
 import unittest
 from contextlib import contextmanager
 
 try:
-    from io import StringIO
-except ImportError:
+    # takes both str and unicode on Python 2
     from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
+import vpk
 from vpk import cli
 
 
@@ -21,6 +28,17 @@ def capture_stdout():
         sys.stdout = old_out
 
 
+@contextmanager
+def capture_stderr():
+    new_err = StringIO()
+    old_err = sys.stderr
+    try:
+        sys.stderr = new_err
+        yield sys.stderr
+    finally:
+        sys.stderr = old_err
+
+
 class testcase_cli(unittest.TestCase):
     def setUp(self):
         self.vpk_path = './tests/test_dir.vpk'
@@ -34,6 +52,20 @@ class testcase_cli(unittest.TestCase):
         stdout = stdout.getvalue().split()
         return stdout
 
+    def run_cli_main(self, args):
+        argv = sys.argv
+        sys.argv = ['vpk'] + args
+        status = 0
+        try:
+            with capture_stdout() as stdout, capture_stderr() as stderr:
+                try:
+                    cli.main()
+                except SystemExit as e:
+                    status = e.code
+        finally:
+            sys.argv = argv
+        return status, stdout.getvalue(), stderr.getvalue()
+
     def test_cli_list(self):
         stdout = self.run_cli_with_args([self.vpk_path, '--list'])
         self.assertEqual(len(stdout), len(self.vpk_content))
@@ -83,3 +115,65 @@ class testcase_cli(unittest.TestCase):
         self.assertEqual(len(stdout), 2)
         self.assertIn(self.vpk_content[0], stdout)
         self.assertIn(self.vpk_content[2], stdout)
+
+    def test_cli_export_tar(self):
+        fd, out_path = tempfile.mkstemp(suffix='.tar')
+        os.close(fd)
+
+        try:
+            self.run_cli_with_args([self.vpk_path, '--export-tar', out_path, '-name', '*.txt'])
+
+            with tarfile.open(out_path) as tar:
+                self.assertEqual(sorted(tar.getnames()), sorted(self.vpk_content[:2]))
+        finally:
+            os.remove(out_path)
+
+    def test_cli_diff(self):
+        stdout = self.run_cli_with_args(['--diff', self.vpk_path, self.vpk_path, '--deep'])
+        self.assertEqual(stdout, [])
+
+    def test_cli_grep(self):
+        stdout = self.run_cli_with_args([self.vpk_path, '--grep', 'line 25'])
+        self.assertEqual(sorted(stdout), ['testdir/testfile2.txt:207', 'testfile1.txt:207'])
+
+        stdout = self.run_cli_with_args([self.vpk_path, '--grep', 'line 2.', '-F'])
+        self.assertEqual(stdout, [])
+
+    def test_cli_grep_invalid(self):
+        status, _, stderr = self.run_cli_main([self.vpk_path, '--grep', '('])
+        self.assertEqual(status, 2)
+        self.assertIn('invalid --grep pattern', stderr)
+
+    def test_cli_stats_json(self):
+        stdout = self.run_cli_with_args([self.vpk_path, '--stats', '--json'])
+        stats = json.loads(' '.join(stdout))
+
+        self.assertEqual(stats['files'], len(self.vpk_content))
+        self.assertEqual(stats['extensions']['txt'], {'files': 2, 'bytes': 432})
+        self.assertEqual(stats['duplicates']['groups'], 1)
+        self.assertEqual(sorted(stats['archives']), ['1', '99'])
+
+    def test_cli_header_md5(self):
+        temp = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(temp, 'file.txt'), 'wb') as f:
+                f.write(b'data')
+            pak_path = os.path.join(temp, 'v2.vpk')
+            vpk.new(temp).save(pak_path)
+
+            stdout = self.run_cli_with_args([pak_path, '--md5'])
+            self.assertEqual(stdout.count('(OK)'), 3)
+            self.assertIn('throughput:', stdout)
+
+            stdout = self.run_cli_with_args([pak_path])
+            self.assertEqual(stdout.count('(OK)'), 0)
+        finally:
+            shutil.rmtree(temp)
+
+    def test_cli_profile(self):
+        status, stdout, stderr = self.run_cli_main([self.vpk_path, '-la', '--profile'])
+
+        self.assertEqual(status, 0)
+        self.assertIn('testfile1.txt', stdout)
+        self.assertIn('Index parse time:', stderr)
+        self.assertIn('test_dir.vpk', stderr)
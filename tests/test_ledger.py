@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import vpk
+from vpk.ledger import VerifyLedger
+
+from tests.counting_vpk import CountingVPK
+
+
+class testcase_ledger(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = tempfile.mkdtemp()
+        for name in ('test_dir.vpk', 'test_001.vpk', 'test_099.vpk'):
+            shutil.copy(os.path.join('./tests', name), self.temp_path)
+
+        self.vpk_path = os.path.join(self.temp_path, 'test_dir.vpk')
+        self.ledger_path = os.path.join(self.temp_path, 'ledger.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def test_skip_unchanged(self):
+        pak = CountingVPK(self.vpk_path)
+        self.assertEqual(pak.verify_entries(ledger=VerifyLedger(self.ledger_path)), set())
+        self.assertEqual(pak.file_opens, 3)
+
+        pak = CountingVPK(self.vpk_path)
+        ledger = VerifyLedger(self.ledger_path)
+        self.assertEqual(len(ledger), 2)
+        self.assertEqual(pak.verify_entries(ledger=ledger), set())
+        self.assertEqual(pak.file_opens, 0)
+
+        pak.verify_entries(ledger=ledger, force=True)
+        self.assertEqual(pak.file_opens, 3)
+
+    def test_changed_archive(self):
+        pak = CountingVPK(self.vpk_path)
+        pak.verify_entries(ledger=VerifyLedger(self.ledger_path))
+
+        with open(os.path.join(self.temp_path, 'test_001.vpk'), 'r+b') as f:
+            f.write(b'X')
+        os.utime(os.path.join(self.temp_path, 'test_001.vpk'), (0, 0))
+
+        pak = CountingVPK(self.vpk_path)
+        self.assertEqual(pak.verify_entries(ledger=VerifyLedger(self.ledger_path)), set(['testfile1.txt']))
+        self.assertEqual(pak.file_opens, 1)
+
+        # failures are remembered too
+        pak = CountingVPK(self.vpk_path)
+        self.assertEqual(pak.verify_entries(ledger=VerifyLedger(self.ledger_path)), set(['testfile1.txt']))
+        self.assertEqual(pak.file_opens, 0)
+
+    def test_verify_md5(self):
+        src = os.path.join(self.temp_path, 'src')
+        os.makedirs(src)
+        with open(os.path.join(src, 'file.txt'), 'wb') as f:
+            f.write(b'data')
+
+        pak = vpk.new(src).save_and_open(os.path.join(self.temp_path, 'v2.vpk'))
+        ledger = VerifyLedger()
+
+        self.assertTrue(pak.verify(ledger=ledger))
+        stats = pak.checksum_stats
+        self.assertTrue(pak.verify(ledger=ledger))
+        self.assertIs(pak.checksum_stats, stats)
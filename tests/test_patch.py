@@ -0,0 +1,91 @@
+import os
+import shutil
+import unittest
+
+import vpk
+import vpk.patch
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class testcase_patch(unittest.TestCase):
+    def setUp(self):
+        self.old_path = './tests/test_dir.vpk'
+        self.temp_path = './tempout_patch'
+        os.makedirs(self.temp_path)
+        self.patch_path = os.path.join(self.temp_path, 'update.vpkpatch')
+
+    def tearDown(self):
+        if os.path.exists(self.temp_path):
+            shutil.rmtree(self.temp_path)
+
+    def test_identical(self):
+        stats = vpk.patch.make_patch(self.old_path, self.old_path, self.patch_path)
+        self.assertEqual(stats['copied'], 216 + 192 + 2)
+
+        out_path = os.path.join(self.temp_path, 'out_dir.vpk')
+        vpk.patch.apply_patch(self.old_path, self.patch_path, out_path)
+
+        for index in (1, 99):
+            self.assertEqual(read(os.path.join(self.temp_path, 'out_%03d.vpk' % index)),
+                             read('./tests/test_%03d.vpk' % index))
+        self.assertEqual(read(out_path), read(self.old_path))
+
+    def test_changed(self):
+        pak = vpk.open(self.old_path)
+        src = os.path.join(self.temp_path, 'src')
+
+        for path in pak:
+            dirname = os.path.join(src, os.path.dirname(path))
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            pak[path].save(os.path.join(src, path))
+
+        with open(os.path.join(src, 'testfile1.txt'), 'ab') as f:
+            f.write(b'line 26\r\n')
+
+        new_path = os.path.join(self.temp_path, 'new.vpk')
+        vpk.new(src).save(new_path)
+
+        stats = vpk.patch.make_patch(self.old_path, new_path, self.patch_path)
+        # testdir/testfile2.txt in new has the same contents as testfile1.txt in old
+        self.assertEqual(stats['copied'], 216 + 2)
+
+        out_path = os.path.join(self.temp_path, 'out.vpk')
+        newpak = vpk.patch.apply_patch(self.old_path, self.patch_path, out_path)
+        self.assertEqual(read(out_path), read(new_path))
+        self.assertTrue(newpak.verify())
+
+    def test_corrupt_source(self):
+        vpk.patch.make_patch(self.old_path, self.old_path, self.patch_path)
+
+        old_dir = os.path.join(self.temp_path, 'old')
+        os.makedirs(old_dir)
+        for name in ('test_dir.vpk', 'test_001.vpk', 'test_099.vpk'):
+            shutil.copy(os.path.join('./tests', name), old_dir)
+
+        with open(os.path.join(old_dir, 'test_001.vpk'), 'r+b') as f:
+            f.write(b'X')
+
+        with self.assertRaises(ValueError):
+            vpk.patch.apply_patch(os.path.join(old_dir, 'test_dir.vpk'),
+                                  self.patch_path,
+                                  os.path.join(self.temp_path, 'out_dir.vpk'))
+
+    def test_invalid_out_path(self):
+        vpk.patch.make_patch(self.old_path, self.old_path, self.patch_path)
+
+        with self.assertRaises(ValueError):
+            vpk.patch.apply_patch(self.old_path, self.patch_path, os.path.join(self.temp_path, 'out.vpk'))
+        with self.assertRaises(ValueError):
+            vpk.patch.apply_patch(self.old_path, self.patch_path, self.old_path)
+
+        self.assertEqual(os.listdir(self.temp_path), ['update.vpkpatch'])
+        self.assertFalse(vpk.open(self.old_path).verify_entries())
+
+    def test_invalid_patch(self):
+        with self.assertRaises(ValueError):
+            vpk.patch.read_manifest(self.old_path)
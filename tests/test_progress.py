@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    # takes both str and unicode on Python 2
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import vpk
+from vpk import cli
+from vpk.progress import ProgressMeter, format_eta
+
+
+class testcase_progress(unittest.TestCase):
+    def setUp(self):
+        self.pak = vpk.open('./tests/test_dir.vpk')
+        self.total = sum(metadata[2] + metadata[5] for _, metadata in self.pak.items())
+        self.temp_path = tempfile.mkdtemp()
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def progress(self, done, total, path):
+        self.calls.append((done, total, path))
+
+    def check_calls(self, paths):
+        self.assertEqual(sorted(path for _, _, path in self.calls), sorted(paths))
+        self.assertEqual([done for done, _, _ in self.calls], sorted(done for done, _, _ in self.calls))
+        self.assertEqual(self.calls[-1][:2], (self.total, self.total))
+
+    def test_extract(self):
+        out_dir = os.path.join(self.temp_path, 'out')
+
+        self.assertEqual(self.pak.extract(out_dir, progress=self.progress)['files'], 3)
+        self.check_calls(list(self.pak))
+
+        for path in self.pak:
+            with open(os.path.join(out_dir, path), 'rb') as f:
+                self.assertEqual(f.read(), self.pak[path].read())
+
+    def test_extract_flat(self):
+        self.pak.extract(self.temp_path, lambda path: path.endswith('.txt'), makedirs=False)
+        self.assertEqual(sorted(os.listdir(self.temp_path)), ['testfile1.txt', 'testfile2.txt'])
+
+    def test_verify(self):
+        self.assertEqual(self.pak.verify_entries(workers=2, progress=self.progress), set())
+        self.check_calls(list(self.pak))
+
+    def test_create(self):
+        src_dir = os.path.join(self.temp_path, 'src')
+        self.pak.extract(src_dir)
+
+        vpk.new(src_dir).save(os.path.join(self.temp_path, 'new.vpk'), progress=self.progress)
+        self.check_calls(list(self.pak))
+
+    def test_cli_create_silent(self):
+        src_dir = os.path.join(self.temp_path, 'src')
+        self.pak.extract(src_dir)
+
+        args = cli.make_argparser().parse_args([os.path.join(self.temp_path, 'new.vpk'), '-c', src_dir])
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            cli.create_vpk(args)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+        self.assertEqual(output, '')
+        self.assertEqual(len(vpk.open(os.path.join(self.temp_path, 'new.vpk'))), 3)
+
+    def test_meter_json(self):
+        stream = StringIO()
+        meter = ProgressMeter(stream, as_json=True, interval=60)
+
+        self.pak.verify_entries(workers=1, progress=meter)
+        meter.close()
+
+        # the first and last updates, the rest are within the interval
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual((lines[-1]['done'], lines[-1]['total'], lines[-1]['eta']), (self.total, self.total, 0))
+
+    def test_meter_text(self):
+        stream = StringIO()
+        meter = ProgressMeter(stream)
+        meter(50, 200, 'file.txt')
+        meter.close()
+
+        self.assertTrue(stream.getvalue().startswith('\r 25.0%'))
+        self.assertTrue(stream.getvalue().endswith('\n'))
+        self.assertEqual(format_eta(3725), '1:02:05')
+        self.assertEqual(format_eta(None), '--:--:--')
@@ -0,0 +1,118 @@
+import threading
+import unittest
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError
+
+import vpk
+from vpk.server import AssetResolver, AssetServer, make_wsgi_app, open_paks, parse_range
+
+
+class testcase_server(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pak = vpk.open('./tests/test_dir.vpk')
+        cls.server = AssetServer(('127.0.0.1', 0), open_paks(['./tests']))
+        cls.url = 'http://127.0.0.1:%d/' % cls.server.server_address[1]
+
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def request(self, path, method='GET', headers=None):
+        req = Request(self.url + path, headers=headers or {})
+        req.get_method = lambda: method
+
+        try:
+            resp = urlopen(req, timeout=10)
+        except HTTPError as exc:
+            return exc.code, exc.headers, exc.read()
+
+        try:
+            return resp.getcode(), resp.headers, resp.read()
+        finally:
+            resp.close()
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 10))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 100))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 100))
+        self.assertEqual(parse_range('bytes=50-1000', 100), (50, 100))
+        self.assertEqual(parse_range('bytes=100-', 100), None)
+        self.assertEqual(parse_range('bytes=0-1,5-6', 100), False)
+        self.assertEqual(parse_range('bytes=20-5', 100), False)
+
+    def test_get(self):
+        for path in self.pak:
+            status, headers, data = self.request(path)
+            self.assertEqual(status, 200)
+            self.assertEqual(data, self.pak[path].read())
+            self.assertEqual(headers['Content-Length'], str(len(data)))
+
+    def test_invalid_range(self):
+        status, _, data = self.request('testfile1.txt', headers={'Range': 'bytes=20-5'})
+        self.assertEqual((status, data), (200, self.pak['testfile1.txt'].read()))
+
+    def test_range(self):
+        # testfile2.txt has 24 bytes of preload, the range spans both parts
+        path = 'testdir/testfile2.txt'
+        expected = self.pak[path].read()
+
+        status, headers, data = self.request(path, headers={'Range': 'bytes=10-49'})
+        self.assertEqual(status, 206)
+        self.assertEqual(data, expected[10:50])
+        self.assertEqual(headers['Content-Range'], 'bytes 10-49/%d' % len(expected))
+
+        status, _, data = self.request(path, headers={'Range': 'bytes=-5'})
+        self.assertEqual((status, data), (206, expected[-5:]))
+
+        status, headers, _ = self.request(path, headers={'Range': 'bytes=1000-'})
+        self.assertEqual(status, 416)
+        self.assertEqual(headers['Content-Range'], 'bytes */%d' % len(expected))
+
+    def test_head_etag(self):
+        meta = self.pak.get_file_meta('testfile1.txt')
+
+        status, headers, data = self.request('testfile1.txt', 'HEAD')
+        self.assertEqual((status, data), (200, b''))
+        self.assertEqual(headers['ETag'], '"%08x-%x"' % (meta['crc32'], meta['file_length']))
+        self.assertEqual(headers['Content-Type'], 'text/plain')
+
+        status, _, data = self.request('testfile1.txt', headers={'If-None-Match': headers['ETag']})
+        self.assertEqual((status, data), (304, b''))
+
+        status, _, data = self.request('testfile1.txt', headers={'Range': 'bytes=0-3', 'If-Range': '"other"'})
+        self.assertEqual((status, len(data)), (200, meta['file_length']))
+
+    def test_errors(self):
+        self.assertEqual(self.request('missing.txt')[0], 404)
+        self.assertEqual(self.request('testfile1.txt', 'DELETE')[0], 405)
+
+    def test_fallback(self):
+        use_sendfile = self.server.use_sendfile
+        self.server.use_sendfile = False
+        try:
+            self.assertEqual(self.request('a/b/c/d/testfile3.bin')[2], self.pak['a/b/c/d/testfile3.bin'].read())
+        finally:
+            self.server.use_sendfile = use_sendfile
+
+    def test_wsgi(self):
+        app = make_wsgi_app(AssetResolver([self.pak]))
+        started = []
+
+        def start_response(status, headers):
+            started.append((status, headers))
+
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/testdir/testfile2.txt', 'HTTP_RANGE': 'bytes=20-29'}
+        data = b''.join(app(environ, start_response))
+
+        self.assertEqual(started[0][0], '206 Partial Content')
+        self.assertEqual(data, self.pak['testdir/testfile2.txt'].read()[20:30])
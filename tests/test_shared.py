@@ -0,0 +1,103 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from multiprocessing import Pool
+
+import vpk
+from vpk.shared import SharedIndex, shared_memory
+
+
+def read_file(args):
+    pak, path = args
+    return pak[path].read()
+
+
+class testcase_shared_index(unittest.TestCase):
+    def setUp(self):
+        self.pak = vpk.open('./tests/test_dir.vpk')
+        self.expected = dict(self.pak.items())
+        self.temp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def check_index(self, index):
+        self.assertEqual(len(index), len(self.expected))
+        self.assertEqual(list(index), sorted(self.expected))
+        self.assertEqual(dict(index.items()), self.expected)
+
+        for path, metadata in self.expected.items():
+            self.assertIn(path, index)
+            self.assertEqual(index[path], metadata)
+
+        self.assertNotIn('missing.txt', index)
+        # on Python 2 these are the same type
+        if bytes is not str:
+            self.assertNotIn(b'testfile1.txt', index)
+        self.assertRaises(KeyError, index.__getitem__, 'missing.txt')
+
+    def test_file(self):
+        index_path = os.path.join(self.temp_path, 'index')
+
+        with SharedIndex.build(self.pak.items(), path=index_path) as index:
+            self.check_index(index)
+            self.assertEqual(index.handle, ('file', index_path))
+
+            with SharedIndex.attach(index.handle) as attached:
+                self.check_index(attached)
+
+            index.unlink()
+
+        self.assertFalse(os.path.exists(index_path))
+
+    @unittest.skipIf(shared_memory is None, "multiprocessing.shared_memory not available")
+    def test_shared_memory(self):
+        index = SharedIndex.build(self.pak.items())
+        try:
+            self.assertEqual(index.handle[0], 'shm')
+            self.check_index(index)
+            self.check_index(pickle.loads(pickle.dumps(index)))
+        finally:
+            index.unlink()
+
+    def test_bytes_paths(self):
+        pak = vpk.open('./tests/test_dir.vpk', path_enc=None)
+
+        with SharedIndex.build(pak.items(), path_enc=None, path=os.path.join(self.temp_path, 'index')) as index:
+            self.assertEqual(sorted(index), sorted(path.encode('utf-8') for path in self.expected))
+            if bytes is not str:
+                self.assertNotIn('testfile1.txt', index)
+            self.assertEqual(index[b'testfile1.txt'], self.expected['testfile1.txt'])
+
+    def test_vpk(self):
+        index = self.pak.share_index(os.path.join(self.temp_path, 'index'))
+        try:
+            self.assertIs(self.pak.tree, index)
+            self.assertEqual(len(self.pak), len(self.expected))
+            self.assertEqual(dict(self.pak.items()), self.expected)
+
+            # only the handle is pickled
+            data = pickle.dumps(self.pak)
+            self.assertNotIn(self.expected['testdir/testfile2.txt'][0], data)
+
+            pak = pickle.loads(data)
+            self.assertIsInstance(pak.tree, SharedIndex)
+
+            for path in self.expected:
+                self.assertEqual(pak[path].read(), self.pak[path].read())
+
+            pak.tree.close()
+        finally:
+            index.unlink()
+
+    def test_process_pool(self):
+        index = self.pak.share_index(os.path.join(self.temp_path, 'index'))
+        pool = Pool(2)
+        try:
+            results = pool.map(read_file, [(self.pak, path) for path in sorted(self.expected)])
+            self.assertEqual(results, [self.pak[path].read() for path in sorted(self.expected)])
+        finally:
+            pool.terminate()
+            index.unlink()
@@ -0,0 +1,76 @@
+import io
+import unittest
+
+import vpk
+from vpk import tracing
+from vpk.tracing import Tracer, TracedFile, trace
+
+
+class testcase_tracing(unittest.TestCase):
+    def setUp(self):
+        self.pak = vpk.open('./tests/test_dir.vpk', cache_size=2**16)
+
+    def test_disabled(self):
+        self.assertIsNone(tracing.get_tracer())
+
+        with self.pak['testfile1.txt'] as f:
+            self.assertNotIsInstance(f._fp, TracedFile)
+
+    def test_counters(self):
+        with trace() as tracer:
+            self.pak.read_index()
+            self.pak['testfile1.txt'].read()
+            self.pak['testfile1.txt'].read()
+
+        self.assertIsNone(tracing.get_tracer())
+
+        stats = tracer.stats()
+        self.assertEqual(stats['index_parses'], 1)
+        self.assertEqual(stats['cache_hits'], 1)
+        self.assertEqual(stats['cache_misses'], 1)
+        self.assertEqual(stats['opens'], 2)
+        self.assertEqual(stats['bytes_read'], self.pak.tree_length + 216)
+
+        archive = stats['files']['./tests/test_001.vpk']
+        self.assertEqual(archive, {'opens': 1, 'seeks': 1, 'reads': 1, 'bytes_read': 216})
+
+    def test_callback(self):
+        events = []
+        tracer = Tracer(lambda event, path, value: events.append((event, path, value)))
+
+        with trace(tracer):
+            self.pak.get_vpkfile_instance('testfile1.txt', self.pak.get_file_meta('testfile1.txt')).read()
+
+        self.assertEqual(events[-3:], [('open', './tests/test_001.vpk', 1),
+                                       ('seek', './tests/test_001.vpk', 1),
+                                       ('read', './tests/test_001.vpk', 216),
+                                       ])
+
+    def test_enable(self):
+        tracer = tracing.enable()
+        try:
+            self.assertEqual(self.pak.verify_entries(workers=2), set())
+        finally:
+            tracing.disable()
+
+        self.assertIsNone(tracing.get_tracer())
+        files = tracer.stats()['files']
+        self.assertEqual(sorted(files), ['./tests/test_001.vpk', './tests/test_099.vpk', './tests/test_dir.vpk'])
+        self.assertEqual(files['./tests/test_001.vpk']['opens'], 1)
+        self.assertEqual(files['./tests/test_001.vpk']['bytes_read'], 216)
+
+        stats = tracer.stats()
+        self.assertEqual(stats['bytes_read'],
+                         self.pak.tree_length + sum(metadata[5] for _, metadata in self.pak.items()))
+
+    def test_readinto(self):
+        class ReadOnly(object):
+            def read(self, size=-1):
+                return b''
+
+        tracer = Tracer()
+        self.assertFalse(hasattr(TracedFile(ReadOnly(), 'file', tracer), 'readinto'))
+
+        buf = bytearray(4)
+        self.assertEqual(TracedFile(io.BytesIO(b'data'), 'file', tracer).readinto(buf), 4)
+        self.assertEqual(tracer.stats()['bytes_read'], 4)
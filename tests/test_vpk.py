@@ -2,7 +2,16 @@ import unittest
 import vpk
 import os
 import errno
+import hashlib
+import io
+import re
 import shutil
+import tarfile
+import tempfile
+import zipfile
+from vpk.ledger import VerifyLedger
+
+from tests.counting_vpk import CountingVPK
 
 def mktree(path):
     try:
@@ -52,6 +61,42 @@ class testcase_vpk(unittest.TestCase):
     def test_filepath_type(self):
         self.assertIsInstance(list(self.pak)[0], _u)
 
+    def test_readline_size(self):
+        with self.pak["testfile1.txt"] as f:
+            self.assertEqual(f.readline(3), b"lin")
+            self.assertEqual(f.readline(), b"e 1\r\n")
+            self.assertEqual(f.tell(), 8)
+
+    def test_mixed_read_readline_seek(self):
+        with self.pak["testdir/testfile2.txt"] as f:
+            data = f.read()
+            f.seek(0)
+            first = f.readline()
+            self.assertEqual(f.read(5), data[len(first):len(first) + 5])
+            f.seek(2)
+            self.assertEqual(f.readline(), data[2:len(first)])
+            f.seek(-10, 2)
+            self.assertEqual(f.read(), data[-10:])
+            self.assertEqual(b''.join(f.readlines()), b'')
+
+            # iteration and tell() agree, with data buffered ahead
+            f.seek(0)
+            lines = iter(f)
+            self.assertEqual(next(lines), first)
+            self.assertEqual(f.tell(), len(first))
+            f.seek(-3, 1)
+            self.assertEqual(f.read(3), first[-3:])
+            self.assertEqual(list(f), data[len(first):].splitlines(True))
+
+    def test_io_wrappers(self):
+        data = self.pak["testdir/testfile2.txt"].read()
+
+        with io.BufferedReader(self.pak["testdir/testfile2.txt"], 16) as f:
+            self.assertEqual(f.read(), data)
+
+        with io.TextIOWrapper(self.pak["testdir/testfile2.txt"], encoding='ascii', newline='') as f:
+            self.assertEqual(f.read(), data.decode('ascii'))
+
 class testcase_vpk_bytes(unittest.TestCase):
     def setUp(self):
         self.pak = vpk.open('./tests/test_dir.vpk', path_enc=None)
@@ -108,9 +153,353 @@ class testcase_newvpk(unittest.TestCase):
             with newpak[path] as f:
                 self.assertTrue(f.verify())
 
+        self.assertTrue(newpak.verify())
+        self.assertEqual(newpak.checksum_stats['bytes'], os.path.getsize(newpak.vpk_path) - 16)
+
+    def test_hash_sections(self):
+        data = os.urandom(10000)
+        first, second, whole = hashlib.md5(), hashlib.md5(), hashlib.md5()
+
+        f = io.BytesIO(data)
+        f.seek(10)
+        length = vpk._hash_sections(f, [(0, [first]), (3000, [first, whole]), (6990, [second, whole])], 1024)
+
+        self.assertEqual(length, 9990)
+        self.assertEqual(first.digest(), hashlib.md5(data[10:3010]).digest())
+        self.assertEqual(second.digest(), hashlib.md5(data[3010:]).digest())
+        self.assertEqual(whole.digest(), hashlib.md5(data[10:]).digest())
+
+        with self.assertRaises(IOError):
+            vpk._hash_sections(io.BytesIO(data), [(20000, [whole])], 1024)
+
+    def tearDown(self):
+        if os.path.exists(self.temp_path):
+            shutil.rmtree(self.temp_path)
+
+
+
+class testcase_vpk_cache(unittest.TestCase):
+    def setUp(self):
+        self.pak = vpk.open('./tests/test_dir.vpk', cache_size=1024, cache_verify=True)
+
+    def test_cache_hits(self):
+        first = self.pak["testfile1.txt"].read()
+        self.assertEqual(self.pak.cache.misses, 1)
+        self.assertEqual(self.pak.cache.hits, 0)
+
+        with self.pak["testfile1.txt"] as f:
+            self.assertIsNone(f._fp)
+            self.assertEqual(f.read(), first)
+            self.assertTrue(f.verify())
+        self.assertEqual(self.pak.cache.hits, 1)
+
+    def test_cache_eviction(self):
+        self.pak.cache.max_bytes = 216 + 2
+        self.pak["testfile1.txt"].read()
+        self.pak["a/b/c/d/testfile3.bin"].read()
+        self.pak["testdir/testfile2.txt"].read()
+
+        self.assertNotIn("testfile1.txt", self.pak.cache)
+        self.assertIn("testdir/testfile2.txt", self.pak.cache)
+        self.assertTrue(self.pak.cache.evictions > 0)
+        self.assertTrue(self.pak.cache.size <= self.pak.cache.max_bytes)
+
+    def test_cache_file_size_limit(self):
+        pak = vpk.open('./tests/test_dir.vpk', cache_size=1024, cache_file_size=4)
+        pak["testfile1.txt"].read()
+        self.assertEqual(len(pak.cache), 0)
+        pak["a/b/c/d/testfile3.bin"].read()
+        self.assertEqual(len(pak.cache), 1)
+
+class testcase_vpk_export(unittest.TestCase):
+    def setUp(self):
+        self.pak = vpk.open('./tests/test_dir.vpk')
+        self.expected = dict((path, self.pak[path].read()) for path in self.pak)
+
+    def test_read_index_sorted(self):
+        entries = self.pak.read_index_sorted()
+        keys = [(metadata[3], metadata[4]) for _, metadata in entries]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(entries), len(self.pak))
+
+    def test_export_tar(self):
+        out = io.BytesIO()
+        self.pak.export_tar(out)
+        out.seek(0)
+
+        with tarfile.open(fileobj=out) as tar:
+            contents = dict((info.name, tar.extractfile(info).read()) for info in tar)
+
+        self.assertEqual(contents, self.expected)
+
+    def test_export_zip_filtered(self):
+        out = io.BytesIO()
+        self.pak.export_zip(out, lambda path: path.endswith('.txt'))
+        out.seek(0)
+
+        with zipfile.ZipFile(out) as zipf:
+            contents = dict((name, zipf.read(name)) for name in zipf.namelist())
+
+        self.assertEqual(sorted(contents), ['testdir/testfile2.txt', 'testfile1.txt'])
+        for path, data in contents.items():
+            self.assertEqual(data, self.expected[path])
+
+class testcase_vpk_diff(unittest.TestCase):
+    def setUp(self):
+        self.pak = vpk.open('./tests/test_dir.vpk')
+        self.temp_path = "./tempout_diff"
+        src = os.path.join(self.temp_path, "src")
+
+        for path in self.pak:
+            mktree(os.path.join(src, *os.path.split(path)[:-1]))
+            self.pak[path].save(os.path.join(src, path))
+
+        with open(os.path.join(src, "testfile1.txt"), 'ab') as f:
+            f.write(b"line 26\r\n")
+        with open(os.path.join(src, "added.txt"), 'wb') as f:
+            f.write(b"new file")
+        os.remove(os.path.join(src, "a/b/c/d/testfile3.bin"))
+
+        self.new_path = os.path.join(self.temp_path, "new.vpk")
+        vpk.new(src).save(self.new_path)
+
     def tearDown(self):
         if os.path.exists(self.temp_path):
             shutil.rmtree(self.temp_path)
 
+    def test_diff(self):
+        result = vpk.diff(self.pak, self.new_path)
+        self.assertEqual(result, {'added': ['added.txt'],
+                                  'removed': ['a/b/c/d/testfile3.bin'],
+                                  'changed': ['testfile1.txt'],
+                                  })
+
+    def test_diff_identical(self):
+        result = vpk.diff(self.pak, './tests/test_dir.vpk', deep=True)
+        self.assertEqual(result, {'added': [], 'removed': [], 'changed': []})
+
+    def test_diff_deep(self):
+        newpak = vpk.open(self.new_path)
+        meta = newpak.get_file_meta("testdir/testfile2.txt")
+
+        # corrupt data, but leave the index untouched
+        with open(self.new_path, 'r+b') as f:
+            f.seek(meta['archive_offset'])
+            f.write(b"X")
+
+        self.assertEqual(vpk.diff(self.pak, self.new_path)['changed'], ['testfile1.txt'])
+        self.assertEqual(vpk.diff(self.pak, self.new_path, deep=True)['changed'],
+                         ['testdir/testfile2.txt', 'testfile1.txt'])
+
+class testcase_vpk_search(unittest.TestCase):
+    def setUp(self):
+        self.pak = vpk.open('./tests/test_dir.vpk')
+
+    def test_search_bytes(self):
+        matches = list(self.pak.search(b"line 25"))
+        self.assertEqual(sorted(matches), [('testdir/testfile2.txt', 207), ('testfile1.txt', 207)])
+
+    def test_search_regex_workers(self):
+        pattern = re.compile(br"^line 1\d\r$", re.M)
+        self.assertEqual(list(self.pak.search(pattern, workers=1)),
+                         list(self.pak.search(pattern, workers=2)))
+        self.assertEqual(len(list(self.pak.search(pattern))), 20)
+
+    def test_search_filter_and_offsets(self):
+        matches = list(self.pak.search(b"line", lambda path: path.startswith("testdir/")))
+        data = self.pak["testdir/testfile2.txt"].read()
+
+        self.assertEqual(len(matches), 25)
+        for path, offset in matches:
+            self.assertEqual(data[offset:offset + 4], b"line")
+
+    def test_search_custom_fopen(self):
+        pak = vpk.open('./tests/test_dir.vpk', fopen=lambda *args: io.open(*args))
+        self.assertEqual(list(pak.search(b"OK")), [('a/b/c/d/testfile3.bin', 0)])
+
+class testcase_vpk_stats(unittest.TestCase):
+    def test_stats(self):
+        stats = vpk.open('./tests/test_dir.vpk').get_stats()
+
+        self.assertEqual(stats['files'], 3)
+        self.assertEqual(stats['bytes'], 216 + 216 + 2)
+        self.assertEqual(stats['preload_bytes'], 24)
+        self.assertEqual(stats['size_histogram'], {2: 1, 128: 2})
+        self.assertEqual(stats['archives'][99], {'files': 2,
+                                                 'bytes': 194,
+                                                 'size': 636,
+                                                 'dead_bytes': 636 - 194,
+                                                 'overlap_bytes': 0,
+                                                 })
+        self.assertEqual(stats['duplicates'], {'groups': 1, 'copies': 2, 'wasted_bytes': 216})
+
+class testcase_vpk_index_reuse(unittest.TestCase):
+    def test_len_after_iteration(self):
+        pak = CountingVPK('./tests/test_dir.vpk')
+        self.assertEqual(sum(1 for path in pak), 3)
+        self.assertEqual(len(pak), 3)
+        self.assertEqual(pak.index_reads, 1)
+        self.assertIsNone(pak.tree)
+
+    def test_partial_iteration(self):
+        pak = CountingVPK('./tests/test_dir.vpk', cache_index=True)
+        next(iter(pak))
+        self.assertIsNone(pak.tree)
+        self.assertEqual(len(pak), 3)
+        self.assertEqual(pak.index_reads, 2)
+
+    def test_cache_index(self):
+        pak = CountingVPK('./tests/test_dir.vpk', cache_index=True)
+        self.assertEqual(len(pak), 3)
+        self.assertEqual(dict(pak.items()), pak.tree)
+        self.assertEqual(sorted(pak), sorted(pak.tree))
+        self.assertEqual(pak["testfile1.txt"].read()[:6], b"line 1")
+        self.assertEqual(pak.index_reads, 1)
+
+    def test_repr_no_index_read(self):
+        pak = CountingVPK('./tests/test_dir.vpk')
+        self.assertIn('read_header_only=True', repr(pak))
+        self.assertEqual(pak.index_reads, 0)
+
+
+
+class testcase_index_array(unittest.TestCase):
+    def setUp(self):
+        self.pak = vpk.open('./tests/test_dir.vpk')
+        self.expected = list(self.pak.items())
+
+    def check_records(self, records, paths):
+        self.assertEqual(paths, [path for path, _ in self.expected])
+
+        for i, (path, metadata) in enumerate(self.expected):
+            self.assertEqual(tuple(int(records[name][i]) for name in vpk.INDEX_FIELDS),
+                             metadata[1:] + (i,))
+
+    def test_fallback(self):
+        records, paths = self.pak.index_array(use_numpy=False)
+        self.assertEqual(list(records), list(vpk.INDEX_FIELDS))
+        self.check_records(records, paths)
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest("numpy not installed")
+
+        records, paths = self.pak.index_array()
+        self.assertIsInstance(records, numpy.ndarray)
+        self.assertEqual(records.dtype.names, vpk.INDEX_FIELDS)
+        self.check_records(records, paths)
+
+        per_archive = numpy.bincount(records['archive_index'], weights=records['file_length'])
+        self.assertEqual(per_archive[1], 216)
+        self.assertEqual(per_archive[99], 194)
+
+    def test_embedded(self):
+        temp_path = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(temp_path, 'file.txt'), 'wb') as f:
+                f.write(b'data')
+            pak = vpk.new(temp_path).save_and_open(os.path.join(temp_path, 'embedded.vpk'))
+
+            for use_numpy in (None, False):
+                records, _ = pak.index_array(use_numpy=use_numpy)
+                self.assertEqual(int(records['archive_offset'][0]), pak.get_file_meta('file.txt')['archive_offset'])
+        finally:
+            shutil.rmtree(temp_path)
+
+
+class testcase_incremental_extract(unittest.TestCase):
+    def setUp(self):
+        self.pak = vpk.open('./tests/test_dir.vpk')
+        self.temp_path = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.temp_path, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def out_path(self, path):
+        return os.path.join(self.out_dir, path)
+
+    def check_contents(self):
+        for path in self.pak:
+            with open(self.out_path(path), 'rb') as f:
+                self.assertEqual(f.read(), self.pak[path].read())
+
+    def test_skip_same_size(self):
+        self.assertEqual(self.pak.extract(self.out_dir)['written'], 3)
+
+        stats = self.pak.extract(self.out_dir, incremental=True)
+        self.assertEqual((stats['written'], stats['skipped']), (0, 3))
+
+        # a different size is noticed without the ledger, different contents aren't
+        with open(self.out_path('testfile1.txt'), 'wb') as f:
+            f.write(b'x' * 216)
+        with open(self.out_path('a/b/c/d/testfile3.bin'), 'wb') as f:
+            f.write(b'x')
+
+        stats = self.pak.extract(self.out_dir, incremental=True)
+        self.assertEqual((stats['written'], stats['skipped']), (1, 2))
+
+    def test_ledger(self):
+        ledger = VerifyLedger(os.path.join(self.temp_path, 'ledger.json'))
+        self.pak.extract(self.out_dir, incremental=True, ledger=ledger)
+
+        with open(self.out_path('testfile1.txt'), 'wb') as f:
+            f.write(b'x' * 216)
+
+        stats = self.pak.extract(self.out_dir, incremental=True,
+                                 ledger=VerifyLedger(os.path.join(self.temp_path, 'ledger.json')))
+        self.assertEqual((stats['written'], stats['skipped']), (1, 2))
+        self.check_contents()
+
+    def test_dedupe(self):
+        # testfile1.txt and testfile2.txt have the same contents
+        stats = self.pak.extract(self.out_dir, dedupe='hardlink')
+        self.assertEqual((stats['written'], stats['linked']), (2, 1))
+        self.assertEqual(os.stat(self.out_path('testfile1.txt')).st_ino,
+                         os.stat(self.out_path('testdir/testfile2.txt')).st_ino)
+        self.check_contents()
+
+        # rewriting doesn't write through the links
+        with open(self.out_path('testfile1.txt'), 'wb') as f:
+            f.write(b'x')
+        with open(self.out_path('testdir/testfile2.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'x')
+
+        self.pak.extract(self.out_dir, lambda path: path == 'testfile1.txt')
+        with open(self.out_path('testdir/testfile2.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'x')
+
+        stats = self.pak.extract(self.out_dir, incremental=True, dedupe='reflink')
+        self.assertEqual((stats['written'], stats['skipped'], stats['linked']), (0, 2, 1))
+        self.check_contents()
+
+    def test_dedupe_flat(self):
+        src = os.path.join(self.temp_path, 'src')
+        for name in ('a', 'b'):
+            os.makedirs(os.path.join(src, name))
+            with open(os.path.join(src, name, 'x.txt'), 'wb') as f:
+                f.write(b'same contents')
+
+        pak_path = os.path.join(self.temp_path, 'flat.vpk')
+        vpk.new(src).save(pak_path)
+
+        # both files end up at out/x.txt
+        stats = vpk.open(pak_path).extract(self.out_dir, makedirs=False, dedupe='hardlink')
+        self.assertEqual((stats['written'], stats['skipped'], stats['linked']), (1, 1, 0))
+        with open(self.out_path('x.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'same contents')
+
+    def test_delete(self):
+        os.makedirs(self.out_path('old/dir'))
+        for path in ('stale.txt', 'old/dir/stale.txt'):
+            with open(self.out_path(path), 'wb') as f:
+                f.write(b'stale')
 
+        ledger = VerifyLedger(self.out_path('ledger.json'))
+        ledger.save()
 
+        stats = self.pak.extract(self.out_dir, lambda path: path.endswith('.txt'), ledger=ledger, delete=True)
+        self.assertEqual((stats['written'], stats['deleted']), (2, 2))
+        self.assertEqual(sorted(os.listdir(self.out_dir)), ['ledger.json', 'testdir', 'testfile1.txt'])
@@ -1,9 +1,28 @@
 import struct
+from array import array
 from binascii import crc32
+from collections import OrderedDict
 from hashlib import md5
 from io import open as fopen
+import io
+import mmap
 import os
+from multiprocessing import cpu_count, Pool
+from multiprocessing.pool import ThreadPool
+import shutil
 import sys
+import tarfile
+import threading
+import time
+import zipfile
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+from vpk.shared import SharedIndex
+from vpk.tracing import get_tracer, _open as _traced_open
 
 __version__ = "1.4.0"
 __author__ = "Rossen Georgiev"
@@ -23,6 +42,58 @@ def new(*args, **kwargs):
     return NewVPK(*args, **kwargs)
 
 
+def diff(old, new, deep=False, workers=None, match_filter=None):
+    """
+    Compares the indexes of two VPKs, without reading any file data.
+    Arguments are VPK instances or paths.
+
+    With ``deep``, entries with matching CRC32 and size are also read and
+    their contents checked against the CRC32 in both VPKs, using ``workers`` threads.
+
+    Returns dict with sorted lists of paths for ``added``, ``removed`` and ``changed``
+    """
+    old = old if isinstance(old, VPK) else VPK(old)
+    new = new if isinstance(new, VPK) else VPK(new)
+
+    def load(pak):
+        index = {}
+        for path, metadata in pak.items():
+            if not match_filter or match_filter(path):
+                index[path] = metadata
+        return index
+
+    old_index = load(old)
+    new_index = load(new)
+
+    added = [path for path in new_index if path not in old_index]
+    removed = [path for path in old_index if path not in new_index]
+    changed = []
+    same = []
+
+    for path, new_meta in new_index.items():
+        old_meta = old_index.get(path)
+
+        if old_meta is None:
+            continue
+
+        # crc32 and total size
+        if (old_meta[1] != new_meta[1]
+           or old_meta[2] + old_meta[5] != new_meta[2] + new_meta[5]):
+            changed.append(path)
+        else:
+            same.append(path)
+
+    if deep and same:
+        bad = old.verify_entries([(path, old_index[path]) for path in same], workers)
+        bad.update(new.verify_entries([(path, new_index[path]) for path in same], workers))
+        changed.extend(bad)
+
+    return {'added': sorted(added),
+            'removed': sorted(removed),
+            'changed': sorted(changed),
+            }
+
+
 class NewVPK(object):
     def __init__(self, path, path_enc='utf-8'):
         self.path_enc = path_enc
@@ -95,10 +166,27 @@ class NewVPK(object):
         return tree_length + 1
 
 
-    def save(self, vpk_output_path):
+    def _file_path(self, ext, relpath, filename):
+        return os.path.join(self.path,
+                            '' if relpath == ' ' else relpath,
+                            filename if not ext else (filename + '.' + ext),
+                            )
+
+    def save(self, vpk_output_path, progress=None):
         """
         Saves the VPK at the given path
+
+        ``progress(done, total, path)`` is called after each file, with bytes
+        written so far and the total size of all files
         """
+        counter = None
+
+        if progress is not None:
+            counter = _ProgressCounter(progress, sum(os.path.getsize(self._file_path(ext, relpath, filename))
+                                                     for ext in self.tree
+                                                     for relpath in self.tree[ext]
+                                                     for filename in self.tree[ext][relpath]))
+
         with fopen(vpk_output_path, 'w+b') as f:
             # write VPK1 header
             f.write(struct.pack("3I", self.signature,
@@ -137,11 +225,7 @@ class NewVPK(object):
                         checksum = 0
                         f.seek(data_offset)
 
-                        with fopen(os.path.join(self.path,
-                                                '' if relpath == ' ' else relpath,
-                                                real_filename
-                                                ),
-                                   'rb') as pakfile:
+                        with fopen(self._file_path(ext, relpath, filename), 'rb') as pakfile:
                             for chunk in iter(lambda: pakfile.read(8192), b''):
                                 checksum = crc32(chunk, checksum)
                                 f.write(chunk)
@@ -151,6 +235,10 @@ class NewVPK(object):
                         f.seek(metadata_offset)
 
                         embed_chunk_length += file_length
+
+                        if counter is not None:
+                            counter.update(file_length, real_filename if relpath == ' '
+                                                        else norm_relpath + '/' + real_filename)
                         # metadata
 
                         # crc32
@@ -184,26 +272,13 @@ class NewVPK(object):
                 chunk_hashes_checksum = md5()
                 file_checksum = md5()
 
-                def chunk_reader(length, chunk_size=2**14):
-                    limit = f.tell() + length
-
-                    while f.tell() < limit:
-                        yield f.read(min(chunk_size, limit - f.tell()))
-
                 f.seek(0) # jump to start
-                file_checksum.update(f.read(self.header_length))
-
-                for chunk in chunk_reader(self.tree_length):
-                    file_checksum.update(chunk)
-                    tree_checksum.update(chunk)
-
-                for chunk in chunk_reader(embed_chunk_length):
-                    file_checksum.update(chunk)
+                _hash_sections(f, [(self.header_length, [file_checksum]),
+                                   (self.tree_length, [file_checksum, tree_checksum]),
+                                   (embed_chunk_length, [file_checksum]),
+                                   ])
 
                 # not supported (chunk_hashes_length == 0)
-                #for chunk in chunk_reader(self.chunk_hashes_length):
-                #    file_checksum.update(chunk)
-                #    chunk_hashes_checksum.update(chunk)
 
                 file_checksum.update(tree_checksum.digest())
                 file_checksum.update(chunk_hashes_checksum.digest())
@@ -221,36 +296,471 @@ class NewVPK(object):
         return VPK(path)
 
 
-def _read_cstring(f, encoding='utf-8'):
-    buf = b''
+def _make_archive_path(vpk_path, archive_index):
+    """
+    Returns path to the archive with the given index, for a _dir.vpk path
+    """
+    if archive_index != 0x7fff:
+        vpk_path = vpk_path.replace('english','').replace("dir.", "%03d." % archive_index)
+
+    return vpk_path
+
+
+def _path_str(path):
+    if isinstance(path, bytes) and not isinstance(path, str):
+        return path.decode('utf-8')
+    return path
+
+
+class _ProgressCounter(object):
+    """
+    Calls ``progress(done, total, path)`` with the number of bytes done,
+    from any thread, in order
+    """
+    def __init__(self, progress, total):
+        self.progress = progress
+        self.total = total
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def update(self, length, path):
+        if self.progress is None:
+            return
+
+        with self._lock:
+            self.done += length
+            self.progress(self.done, self.total, path)
+
+
+def _file_crc32(path, chunk_size=2**16):
+    checksum = 0
+
+    with fopen(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            checksum = crc32(chunk, checksum)
+
+    return checksum & 0xffffffff
+
+
+def _same_contents(vpkfile, path, chunk_size=2**16):
+    """
+    Returns True when the file at path has the contents of vpkfile
+    """
+    with fopen(path, 'rb') as f:
+        vpkfile.seek(0)
+
+        while True:
+            chunk = vpkfile.read(chunk_size)
+            if chunk != f.read(len(chunk) or 1):
+                return False
+            if not chunk:
+                return True
+
+
+# ioctl to share the extents of a file, on Linux file systems that support it
+_FICLONE = 0x40049409
+
+
+def _link_file(src, dst, mode='hardlink'):
+    """
+    Makes dst a hardlink or reflink of src, or a copy where that isn't possible
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    try:
+        if mode == 'hardlink':
+            os.link(src, dst)
+            return
+        if mode == 'reflink':
+            import fcntl
+            with fopen(src, 'rb') as fsrc, fopen(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return
+    except (IOError, OSError, ImportError, AttributeError):
+        pass
+
+    shutil.copyfile(src, dst)
+
+
+class _SharedHandle(object):
+    """
+    Proxy for a shared file handle, which ignores close()
+    """
+    def __init__(self, fp):
+        self._fp = fp
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+    def close(self):
+        pass
+
+
+class _ArchiveHandles(object):
+    """
+    Drop-in for ``fopen`` that keeps one open handle per archive,
+    so bulk operations don't reopen the archive for every file
+    """
+    # handles are traced when opened, not again for every file using them
+    traced = True
+
+    def __init__(self, fopen):
+        self.fopen = fopen
+        self._handles = {}
+
+    def __call__(self, path, mode='rb'):
+        fp = self._handles.get(path)
+
+        if fp is None:
+            fp = self._handles[path] = _traced_open(self.fopen, path, mode)
+
+        return _SharedHandle(fp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        for fp in self._handles.values():
+            fp.close()
+        self._handles.clear()
+
+
+def _search_buffer(buf, pattern, start=0, end=None):
+    """
+    Returns list of offsets (relative to start) where pattern matches in buf
+    """
+    end = len(buf) if end is None else end
+    offsets = []
+
+    if isinstance(pattern, bytes):
+        pos = buf.find(pattern, start, end)
+        while pos > -1:
+            offsets.append(pos - start)
+            pos = buf.find(pattern, pos + 1, end)
+    else:
+        # a view of just the file, so anchors match at its start and end
+        if hasattr(memoryview, 'release'):
+            view = memoryview(buf)[start:end]
+        else:
+            # Python 2 can't make views of mmaps, or match on views
+            view = buf[start:end]
+
+        try:
+            offsets.extend(match.start() for match in pattern.finditer(view))
+        finally:
+            if isinstance(view, memoryview):
+                view.release()
+
+    return offsets
+
+
+def _search_entries(archive_path, entries, pattern, fopen=fopen):
+    """
+    Searches entries (file_path, preload, archive_offset, file_length) from one archive
+    """
+    matches = []
+
+    with _traced_open(fopen, archive_path) as f:
+        for path, preload, archive_offset, file_length in entries:
+            f.seek(archive_offset)
+            data = preload + f.read(file_length)
+            matches.extend((path, offset) for offset in _search_buffer(data, pattern))
+
+    return matches
+
+
+def _search_task(task):
+    archive_path, entries, pattern = task
 
-    for chunk in iter(lambda: f.read(64), b''):
-        pos = chunk.find(b'\x00')
-        if pos > -1:
-            buf += chunk[:pos]
-            f.seek(f.tell() - (len(chunk) - (pos + 1)))
+    if not any(entry[3] for entry in entries):
+        return _search_entries(archive_path, entries, pattern)
+
+    matches = []
+
+    with fopen(archive_path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            for path, preload, archive_offset, file_length in entries:
+                if preload:
+                    # matches may span across preload and archive data
+                    data = preload + mm[archive_offset:archive_offset + file_length]
+                    offsets = _search_buffer(data, pattern)
+                else:
+                    offsets = _search_buffer(mm, pattern, archive_offset, archive_offset + file_length)
+
+                matches.extend((path, offset) for offset in offsets)
+        finally:
+            mm.close()
+
+    return matches
+
+
+def _hash_sections(f, sections, block_size=2**20):
+    """
+    Feeds consecutive sections of f, from the current position, to hash objects.
+    Reads go into two reused buffers on a background thread, so hashing of one
+    block overlaps with reading the next.
+
+    sections is a list of (length, [hash objects])
+
+    Returns number of bytes hashed
+    """
+    total = sum(length for length, _ in sections)
+    free = Queue()
+    full = Queue()
+
+    for _ in range(2):
+        free.put(bytearray(block_size))
+
+    def reader():
+        left = total
+        try:
+            while left > 0:
+                buf = free.get()
+                view = memoryview(buf)[:min(block_size, left)]
+
+                if hasattr(f, 'readinto'):
+                    n = f.readinto(view)
+                else:
+                    data = f.read(len(view))
+                    n = len(data)
+                    view[:n] = data
+
+                if not n:
+                    raise IOError("Unexpected end of file")
+
+                left -= n
+                full.put((buf, n))
+
+            full.put((None, 0))
+        except Exception as exc:
+            full.put((exc, 0))
+
+    thread = threading.Thread(target=reader)
+    thread.daemon = True
+    thread.start()
+
+    sections = iter(sections)
+    section_left, hashes = 0, []
+
+    while True:
+        buf, n = full.get()
+
+        if buf is None:
             break
+        if isinstance(buf, Exception):
+            raise buf
+
+        view = memoryview(buf)[:n]
+        pos = 0
+
+        while pos < n:
+            while section_left == 0:
+                section_left, hashes = next(sections)
+
+            chunk = view[pos:pos + min(n - pos, section_left)]
+            for checksum in hashes:
+                checksum.update(chunk)
+
+            pos += len(chunk)
+            section_left -= len(chunk)
+
+        free.put(buf)
+
+    thread.join()
+
+    return total
+
+
+_metadata_struct = struct.Struct("IHHIIH")
+
+#: fields of the records returned by :meth:`VPK.index_array`
+INDEX_FIELDS = ('crc32', 'preload_length', 'archive_index', 'archive_offset', 'file_length', 'path_id')
+
+
+def _walk_tree(tree, encoding='utf-8'):
+    """Generator function that walks a raw directory tree
+
+    yields (file_path, offset, metadata), where offset points at the preload data
+    and metadata is (crc32, preload_length, archive_index, archive_offset, file_length)
+    """
+    find = tree.find
+    unpack_from = _metadata_struct.unpack_from
+    decode = (lambda s: s.decode(encoding)) if encoding else (lambda s: s)
+    _sblank, _sempty, _sdot, _ssep = ((' ', '', '.', '/')
+                                      if encoding else
+                                      (b' ', b'', b'.', b'/'))
+
+    def read_cstring(pos):
+        end = find(b'\x00', pos)
+        if end < 0:
+            raise ValueError("Error parsing index (out of bounds)")
+        return tree[pos:end], end + 1
+
+    pos = 0
+
+    while True:
+        ext, pos = read_cstring(pos)
+        if not ext:
+            break
+
+        ext = _sdot + decode(ext)
+
+        while True:
+            path, pos = read_cstring(pos)
+            if not path:
+                break
+
+            path = decode(path)
+            path = path + _ssep if path != _sblank else _sempty
+
+            while True:
+                name, pos = read_cstring(pos)
+                if not name:
+                    break
+
+                try:
+                    metadata = unpack_from(tree, pos)
+                except struct.error:
+                    raise ValueError("Error parsing index (out of bounds)")
 
-        buf += chunk
+                if metadata[5] != 0xffff:
+                    raise ValueError("Error while parsing index")
+
+                pos += 18
+                yield path + decode(name) + ext, pos, metadata[:5]
+                pos += metadata[1]
+
+
+class ContentCache(object):
+    """
+    Size bounded LRU cache for the contents of small files
+
+    Entries are evicted in least recently used order once the total
+    size of the cached contents exceeds ``max_bytes``
+    """
+    def __init__(self, max_bytes, max_file_size=2**16, verify=False):
+        self.max_bytes = max_bytes
+        self.max_file_size = min(max_file_size, max_bytes)
+        self.verify = verify
+
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "%s(max_bytes=%d, size=%d, entries=%d)" % (
+            self.__class__.__name__, self.max_bytes, self.size, len(self))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getstate__(self):
+        # contents are not sent to other processes
+        return self.max_bytes, self.max_file_size, self.verify
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key):
+        """
+        Returns cached contents for key, or None
+        """
+        with self._lock:
+            data = self._data.pop(key, None)
+
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data[key] = data
+
+            return data
+
+    def put(self, key, data):
+        """
+        Adds contents to the cache, evicting old entries when full
+        """
+        if len(data) > self.max_file_size:
+            return
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+
+            self._data[key] = data
+            self.size += len(data)
+
+            while self.size > self.max_bytes:
+                _, old = self._data.popitem(last=False)
+                self.size -= len(old)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns a dict with the cache counters
+        """
+        return {'entries': len(self._data),
+                'size': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                }
 
-    return buf.decode(encoding) if encoding else buf
 
 class VPK(object):
     """
     Wrapper for reading Valve's Pak files
+
+    Setting ``cache_size`` (in bytes) enables a LRU cache for the contents of
+    files no larger than ``cache_file_size``, returned by :meth:`get_file`.
+    With ``cache_verify`` the CRC32 of contents is checked before caching.
+
+    ``cache_index`` selects the memory vs speed trade-off for the index.
+    When ``False``, iteration streams the index from the file and only the
+    number of files is remembered. When ``True``, the first full pass over
+    the index is kept in ``tree`` and reused for iteration, ``len()`` and lookups.
+    Lookups with :meth:`get_file` always load the full index.
     """
     signature = 0
     version = 0
     tree_length = 0
     header_length = 0
+    checksum_stats = None
 
-    def __init__(self, vpk_path, read_header_only=True, path_enc='utf-8', fopen=fopen):
+    def __init__(self, vpk_path, read_header_only=True, path_enc='utf-8', fopen=fopen,
+                 cache_size=0, cache_file_size=2**16, cache_verify=False, cache_index=False):
         self.path_enc = path_enc
         self.fopen = fopen
+        self.cache = None
+        self.cache_index = cache_index
+
+        if cache_size > 0:
+            self.cache = ContentCache(cache_size, cache_file_size, cache_verify)
 
         # header
         self.tree = None
         self.vpk_path = vpk_path
+        self._num_files = None
 
         self.read_header()
 
@@ -258,37 +768,53 @@ class VPK(object):
             self.read_index()
 
     def __repr__(self):
-        headonly = ', read_header_only=True' if len(self) == 0 else ''
+        headonly = ', read_header_only=True' if self.tree is None else ''
         return "%s('%s'%s)" % (self.__class__.__name__, self.vpk_path, headonly)
 
     def __iter__(self):
-        if self.tree is None:
-            def path_generator():
-                for path, meta in self.read_index_iter():
-                    yield path
-
-            return iter(path_generator())
-        else:
-            return iter(self.tree)
+        return (path for path, _ in self._iter_index())
 
     def items(self):
-        if self.tree is None:
-            tree = self.read_index_iter()
+        items = self._iter_index()
 
-            return tree if sys.version_info >= (3,) else list(tree)
-        else:
-            return self.tree.items()
+        return items if sys.version_info >= (3,) else list(items)
 
     def __len__(self):
-        if self.tree is None:
-            length = 0
-            for _ in self.read_index_iter():
-                length += 1
-
-            return length
-        else:
+        if self.tree is not None:
             return len(self.tree)
 
+        if self._num_files is None:
+            for _ in self._iter_index():
+                pass
+
+        return self._num_files
+
+    def _iter_index(self):
+        """
+        Generator function yielding (file_path, metadata) from the loaded index,
+        otherwise reads the index, remembering the number of files and,
+        depending on ``cache_index``, the whole index
+        """
+        if self.tree is not None:
+            for item in self.tree.items():
+                yield item
+            return
+
+        tree = {} if self.cache_index else None
+        num_files = 0
+
+        for path, metadata in self.read_index_iter():
+            num_files += 1
+            if tree is not None:
+                tree[path] = metadata
+
+            yield path, metadata
+
+        self._num_files = num_files
+
+        if tree is not None and self.tree is None:
+            self.tree = tree
+
     def __enter__(self):
         return self
 
@@ -306,8 +832,37 @@ class VPK(object):
         Returns VPKFile instance for the given path
         """
         metadata = self.get_file_meta(path)
+
+        if (self.cache is not None
+           and metadata['preload_length'] + metadata['file_length'] <= self.cache.max_file_size):
+            return self._get_cached_vpkfile(path, metadata)
+
         return self.get_vpkfile_instance(path, metadata)
 
+    def _get_cached_vpkfile(self, path, metadata):
+        data = self.cache.get(path)
+
+        tracer = get_tracer()
+        if tracer is not None:
+            tracer.record('cache_miss' if data is None else 'cache_hit', path)
+
+        if data is None:
+            with self.get_vpkfile_instance(path, metadata) as vpkfile:
+                data = vpkfile.read()
+
+            if self.cache.verify and crc32(data) & 0xffffffff != metadata['crc32']:
+                raise ValueError("CRC32 mismatch for %s" % repr(path))
+
+            self.cache.put(path, data)
+
+        # serve the contents from memory as if they were all preload data
+        metadata = dict(metadata,
+                        preload=data,
+                        preload_length=len(data),
+                        file_length=0,
+                        )
+        return VPKFile(None, filepath=path, fopen=self.fopen, **metadata)
+
     def get_file_meta(self, path):
         """
         Returns metadata for given file path
@@ -320,18 +875,528 @@ class VPK(object):
 
         return self._make_meta_dict(self.tree[path])
 
-    def get_vpkfile_instance(self, path, metadata):
+    def get_vpkfile_instance(self, path, metadata, fopen=None):
         if isinstance(metadata, tuple):
             metadata = self._make_meta_dict(metadata)
-        return VPKFile(self._make_vpkfile_path(metadata), filepath=path, fopen=self.fopen, **metadata)
+        return VPKFile(self._make_vpkfile_path(metadata),
+                       filepath=path,
+                       fopen=fopen or self.fopen,
+                       **metadata)
 
-    def _make_vpkfile_path(self, metadata):
-        path = self.vpk_path
+    def share_index(self, path=None):
+        """
+        Replaces ``tree`` with a :class:`vpk.shared.SharedIndex`, in shared memory
+        or in the file at path, and returns it. Other processes can use it via
+        ``SharedIndex.attach(index.handle)``, and pickling this instance only
+        sends the handle.
+        """
+        index = SharedIndex.build(self._iter_index(), self.path_enc, path)
+        self.tree = index
+        self._num_files = len(index)
+        return index
+
+    def read_index_sorted(self, match_filter=None):
+        """
+        Returns a list of (file_path, metadata) sorted by archive and offset,
+        for sequential reading of many files
+        """
+        entries = [(path, metadata) for path, metadata in self._iter_index()
+                   if not match_filter or match_filter(path)]
+        entries.sort(key=lambda entry: (entry[1][3], entry[1][4]))
+        return entries
 
-        if metadata['archive_index'] != 0x7fff:
-            path = path.replace('english','').replace("dir.", "%03d." % metadata['archive_index'])
+    def index_array(self, use_numpy=None):
+        """
+        Returns (records, paths) for bulk analysis of the index, where paths
+        is a list of file paths and records has the fields of :data:`INDEX_FIELDS`,
+        ``path_id`` being the position in paths.
+
+        records is a NumPy structured array, or without NumPy (or with
+        ``use_numpy=False``) a dict of ``array.array`` columns.
+        Either way, ``records['file_length']`` is the column of file lengths.
+        """
+        if use_numpy is not False:
+            try:
+                import numpy
+            except ImportError:
+                if use_numpy:
+                    raise
+                numpy = None
+        else:
+            numpy = None
+
+        tree = self._read_tree()
+        data_offset = self.header_length + self.tree_length
+        paths = []
+
+        if numpy is None:
+            columns = OrderedDict((name, array(typecode)) for name, typecode in zip(INDEX_FIELDS, 'IHHIII'))
+            appends = [column.append for column in columns.values()]
+
+            for path_id, (path, _, metadata) in enumerate(_walk_tree(tree, self.path_enc)):
+                paths.append(path)
+
+                if metadata[2] == 0x7fff:
+                    metadata = metadata[:3] + (metadata[3] + data_offset,) + metadata[4:]
+
+                for append, value in zip(appends, metadata + (path_id,)):
+                    append(value)
+
+            return columns, paths
+
+        # copy the metadata out of the tree, skipping names and preload data
+        raw = []
+        for path, pos, _ in _walk_tree(tree, self.path_enc):
+            paths.append(path)
+            raw.append(tree[pos - _metadata_struct.size:pos])
+
+        types = ('<u4', '<u2', '<u2', '<u4', '<u4')
+        raw = numpy.frombuffer(b''.join(raw), dtype=list(zip(INDEX_FIELDS[:5], types)) + [('terminator', '<u2')])
+
+        records = numpy.empty(len(raw), dtype=list(zip(INDEX_FIELDS, types + ('<u4',))))
+        for name in INDEX_FIELDS[:5]:
+            records[name] = raw[name]
+        records['path_id'] = numpy.arange(len(raw))
+
+        archive_offset = records['archive_offset']
+        archive_offset[records['archive_index'] == 0x7fff] += data_offset
+
+        return records, paths
+
+    def get_stats(self):
+        """
+        Computes statistics about files and archive layout, from one pass over the index.
+        No file data is read, archive sizes are taken from the file system when available.
+
+        Returns dict
+        """
+        extensions = {}
+        archives = {}
+        histogram = {}
+        contents = {}
+        total_bytes = preload_bytes = 0
+        archive_switches = steps = forward_reads = seek_distance = 0
+        prev_archive = prev_end = None
+        _sdot = '.' if self.path_enc else b'.'
+
+        for path, metadata in self._iter_index():
+            _, crc, preload_length, archive_index, archive_offset, file_length = metadata
+            size = preload_length + file_length
+
+            total_bytes += size
+            preload_bytes += preload_length
+
+            ext = path.rsplit(_sdot, 1)[-1]
+            ext_stats = extensions.setdefault(_path_str(ext), {'files': 0, 'bytes': 0})
+            ext_stats['files'] += 1
+            ext_stats['bytes'] += size
+
+            bucket = size.bit_length()
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+
+            contents.setdefault((crc, size), set()).add((archive_index, archive_offset, file_length))
+
+            if file_length == 0:
+                continue
+
+            archive = archives.setdefault(archive_index, {'files': 0, 'bytes': 0, 'ranges': []})
+            archive['files'] += 1
+            archive['bytes'] += file_length
+            archive['ranges'].append((archive_offset, file_length))
+
+            # read locality, when reading files in index order
+            if archive_index != prev_archive:
+                archive_switches += 1
+            else:
+                steps += 1
+                if archive_offset >= prev_end:
+                    forward_reads += 1
+                seek_distance += abs(archive_offset - prev_end)
+
+            prev_archive = archive_index
+            prev_end = archive_offset + file_length
+
+        num_files = sum(ext['files'] for ext in extensions.values())
+
+        for archive_index, archive in archives.items():
+            archive.update(self._get_archive_layout(archive_index, archive.pop('ranges')))
+
+        # same crc and size, but stored more than once
+        duplicates = {'groups': 0, 'copies': 0, 'wasted_bytes': 0}
+        for (crc, size), ranges in contents.items():
+            if len(ranges) > 1:
+                duplicates['groups'] += 1
+                duplicates['copies'] += len(ranges)
+                duplicates['wasted_bytes'] += size * (len(ranges) - 1)
+
+        return {'files': num_files,
+                'bytes': total_bytes,
+                'preload_bytes': preload_bytes,
+                'extensions': extensions,
+                'archives': archives,
+                'size_histogram': dict((0 if b == 0 else 2**(b-1), n) for b, n in histogram.items()),
+                'duplicates': duplicates,
+                'locality': {'archive_switches': archive_switches,
+                             'forward_reads': forward_reads,
+                             'backward_reads': steps - forward_reads,
+                             'mean_seek_distance': seek_distance // max(steps, 1),
+                             },
+                }
+
+    def _get_archive_layout(self, archive_index, ranges):
+        """
+        Computes size, unused and overlapping bytes of an archive, from the file ranges in it
+        """
+        start = 0
+        end = None
 
-        return path
+        if archive_index == 0x7fff:
+            start = self.header_length + self.tree_length
+            if self.version == 2:
+                end = start + self.embed_chunk_length
+
+        if end is None:
+            try:
+                end = os.path.getsize(self._make_vpkfile_path({'archive_index': archive_index}))
+            except OSError:
+                pass
+
+        dead = overlap = 0
+        cursor = start
+
+        for offset, length in sorted(set(ranges)):
+            if offset > cursor:
+                dead += offset - cursor
+            else:
+                overlap += min(cursor, offset + length) - offset
+
+            cursor = max(cursor, offset + length)
+
+        if end is not None:
+            dead += max(end - cursor, 0)
+
+        return {'size': None if end is None else end - start,
+                'dead_bytes': dead,
+                'overlap_bytes': overlap,
+                }
+
+    def verify_entries(self, entries=None, workers=None, ledger=None, force=False, progress=None):
+        """
+        Checks contents against the CRC32 in the index. Archives are read
+        sequentially, in parallel on ``workers`` threads.
+
+        entries is a list of (file_path, metadata), or None for all files
+
+        With a :class:`vpk.ledger.VerifyLedger`, archives that haven't changed
+        since they were last fully verified are skipped, unless ``force`` is set.
+
+        ``progress(done, total, path)`` is called after each file, with bytes
+        verified so far and the total size of files to verify
+
+        Returns a set of paths that failed verification
+        """
+        full = entries is None
+
+        if full:
+            entries = self._iter_index()
+
+        archives = {}
+        for path, metadata in entries:
+            archives.setdefault(metadata[3], []).append((path, metadata))
+
+        failed = set()
+
+        if ledger is not None:
+            for archive_index in list(archives):
+                result = None if force else ledger.get(*self._ledger_key(archive_index))
+
+                if result is not None:
+                    paths = set(path for path, _ in archives.pop(archive_index))
+                    failed.update(path for path in map(self._ledger_path, result) if path in paths)
+
+        counter = _ProgressCounter(progress, sum(metadata[2] + metadata[5]
+                                                 for entries in archives.values()
+                                                 for _, metadata in entries))
+
+        def verify_archive(entries):
+            entries.sort(key=lambda entry: entry[1][4])
+            failed = []
+
+            with _ArchiveHandles(self.fopen) as handles:
+                for path, metadata in entries:
+                    with self.get_vpkfile_instance(path, metadata, fopen=handles) as vpkfile:
+                        if not vpkfile.verify():
+                            failed.append(path)
+
+                    counter.update(metadata[2] + metadata[5], path)
+
+            return failed
+
+        indexes = list(archives)
+        groups = [archives[archive_index] for archive_index in indexes]
+
+        if workers == 1 or len(groups) <= 1:
+            results = list(map(verify_archive, groups))
+        else:
+            pool = ThreadPool(min(workers or cpu_count(), len(groups)))
+            try:
+                results = pool.map(verify_archive, groups)
+            finally:
+                pool.close()
+
+        for archive_index, paths in zip(indexes, results):
+            failed.update(paths)
+
+            # only results covering the whole archive can be reused
+            if ledger is not None and full:
+                key, files = self._ledger_key(archive_index)
+                ledger.set(key, files, [path if self.path_enc else path.decode('latin-1')
+                                        for path in paths])
+
+        if ledger is not None and full:
+            ledger.save()
+
+        return failed
+
+    def _ledger_key(self, archive_index=None):
+        """
+        Returns (key, files) for a ledger entry, the MD5 checksums
+        when archive_index is None, otherwise the CRC32s of an archive
+        """
+        files = [self.vpk_path]
+
+        if archive_index is None:
+            key = "md5:%s" % os.path.abspath(self.vpk_path)
+        else:
+            key = "crc32:%s:%s:%d" % (os.path.abspath(self.vpk_path), self.path_enc, archive_index)
+
+            if archive_index != 0x7fff:
+                files.append(self._make_vpkfile_path({'archive_index': archive_index}))
+
+        return key, files
+
+    def _ledger_path(self, path):
+        return path if self.path_enc else path.encode('latin-1')
+
+    def search(self, pattern, match_filter=None, workers=None, chunk_size=2**26):
+        """
+        Generator function that searches the contents of files for pattern,
+        which is bytes, or a compiled bytes regular expression.
+        Archives are memory mapped and scanned in offset order, split into
+        tasks of about ``chunk_size`` bytes that run on ``workers`` processes.
+
+        yields (file_path, offset) for each match
+        """
+        if not isinstance(pattern, bytes) and not hasattr(pattern, 'finditer'):
+            pattern = pattern.encode('utf-8')
+
+        tasks = []
+        task, task_size, task_archive = [], 0, None
+
+        for path, metadata in self.read_index_sorted(match_filter):
+            archive_path = self._make_vpkfile_path(self._make_meta_dict(metadata))
+
+            if task and (task_archive != archive_path or task_size >= chunk_size):
+                tasks.append((task_archive, task, pattern))
+                task, task_size = [], 0
+
+            task_archive = archive_path
+            task.append((path, metadata[0], metadata[4], metadata[5]))
+            task_size += metadata[2] + metadata[5]
+
+        if task:
+            tasks.append((task_archive, task, pattern))
+
+        # custom fopen can't be used from other processes, nor with mmap
+        if self.fopen is not fopen:
+            for archive_path, entries, pattern in tasks:
+                for match in _search_entries(archive_path, entries, pattern, self.fopen):
+                    yield match
+            return
+
+        pool = None
+
+        if workers == 1 or len(tasks) <= 1:
+            results = map(_search_task, tasks)
+        else:
+            pool = Pool(min(workers or cpu_count(), len(tasks)))
+            results = pool.imap(_search_task, tasks)
+
+        try:
+            for matches in results:
+                for match in matches:
+                    yield match
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def extract(self, out_dir, match_filter=None, makedirs=True, progress=None,
+                incremental=False, ledger=None, dedupe=None, delete=False):
+        """
+        Extracts files to out_dir, reading them in archive offset order.
+        Without ``makedirs``, all files are written directly in out_dir.
+
+        ``progress(done, total, path)`` is called after each file, with bytes
+        extracted so far and the total size of files to extract
+
+        With ``incremental``, existing files of the right size are left alone.
+        With a :class:`vpk.ledger.VerifyLedger` their CRC32 is checked as well,
+        computed only for files that changed since it was last recorded.
+
+        With ``dedupe`` set to ``'hardlink'`` or ``'reflink'``, files with the
+        same contents (same archive range, or same CRC32 and size and compared
+        equal) are written once and linked, or copied where linking fails.
+
+        With ``delete``, files in out_dir that weren't extracted are removed,
+        along with directories left empty.
+
+        Returns dict with number of ``files``, and how many were ``written``,
+        ``skipped``, ``linked`` and ``deleted``
+        """
+        entries = self.read_index_sorted(match_filter)
+        counter = _ProgressCounter(progress, sum(metadata[2] + metadata[5] for _, metadata in entries))
+        stats = {'files': len(entries), 'written': 0, 'skipped': 0, 'linked': 0, 'deleted': 0}
+
+        # dedupe key -> (path of the first file, it was written in this run)
+        written = {}
+        out_paths = set()
+
+        def up_to_date(out_path, metadata):
+            try:
+                if os.path.getsize(out_path) != metadata[2] + metadata[5]:
+                    return False
+            except OSError:
+                return False
+
+            if ledger is None:
+                return True
+
+            key = "extract:%s" % os.path.abspath(out_path)
+            checksum = ledger.get(key, [out_path])
+
+            if checksum is None:
+                checksum = _file_crc32(out_path)
+                ledger.set(key, [out_path], checksum)
+
+            return checksum == metadata[1]
+
+        with _ArchiveHandles(self.fopen) as handles:
+            for path, metadata in entries:
+                preload, crc, preload_length, archive_index, archive_offset, file_length = metadata
+                relpath = _path_str(path)
+                out_path = os.path.join(out_dir, relpath if makedirs else relpath.split('/')[-1])
+                out_paths.add(os.path.normpath(out_path))
+
+                dirname = os.path.dirname(out_path)
+                if dirname and not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+
+                size = preload_length + file_length
+                same_range = (archive_index, archive_offset, file_length, preload)
+                source = written.get(same_range) if dedupe and size > 0 else None
+
+                # copies of a rewritten file are relinked, even if they look up to date
+                skip = (incremental
+                        and not (source is not None and source[1])
+                        and up_to_date(out_path, metadata))
+
+                if not skip and dedupe and size > 0 and source is None and (crc, size) in written:
+                    candidate = written[(crc, size)]
+                    with self.get_vpkfile_instance(path, metadata, fopen=handles) as vpkfile:
+                        if _same_contents(vpkfile, candidate[0]):
+                            source = candidate
+
+                if skip:
+                    stats['skipped'] += 1
+                    is_written = False
+                elif source is not None and os.path.normpath(source[0]) == os.path.normpath(out_path):
+                    # without makedirs, a file with the same name and contents is already there
+                    stats['skipped'] += 1
+                    is_written = source[1]
+                elif source is not None:
+                    _link_file(source[0], out_path, dedupe)
+                    stats['linked'] += 1
+                    is_written = True
+                else:
+                    if os.path.lexists(out_path):
+                        # don't write through hardlinks
+                        os.remove(out_path)
+
+                    with self.get_vpkfile_instance(path, metadata, fopen=handles) as vpkfile:
+                        vpkfile.save(out_path)
+                    stats['written'] += 1
+                    is_written = True
+
+                if is_written and ledger is not None:
+                    ledger.set("extract:%s" % os.path.abspath(out_path), [out_path], crc)
+
+                if dedupe and size > 0 and source is None:
+                    written.setdefault(same_range, (out_path, is_written))
+                    written.setdefault((crc, size), (out_path, is_written))
+
+                counter.update(size, path)
+
+        if delete:
+            keep = set([os.path.normpath(ledger.path)]) if ledger is not None and ledger.path else set()
+
+            for root, dirs, files in os.walk(out_dir, topdown=False):
+                for name in files:
+                    file_path = os.path.normpath(os.path.join(root, name))
+                    if file_path not in out_paths and file_path not in keep:
+                        os.remove(file_path)
+                        stats['deleted'] += 1
+
+                if os.path.normpath(root) != os.path.normpath(out_dir) and not os.listdir(root):
+                    os.rmdir(root)
+
+        if ledger is not None:
+            ledger.save()
+
+        return stats
+
+    def export_tar(self, fileobj, match_filter=None, mtime=None):
+        """
+        Writes files as a tar stream to fileobj, which doesn't need to be seekable
+        """
+        mtime = time.time() if mtime is None else mtime
+
+        tar = tarfile.open(fileobj=fileobj, mode='w|')
+
+        with _ArchiveHandles(self.fopen) as handles:
+            for path, metadata in self.read_index_sorted(match_filter):
+                info = tarfile.TarInfo(_path_str(path))
+                info.size = metadata[2] + metadata[5]
+                info.mtime = mtime
+
+                with self.get_vpkfile_instance(path, metadata, fopen=handles) as vpkfile:
+                    tar.addfile(info, vpkfile)
+
+        tar.close()
+
+    def export_zip(self, fileobj, match_filter=None, compression=zipfile.ZIP_STORED):
+        """
+        Writes files as a zip stream to fileobj, which doesn't need to be seekable
+        """
+        zipf = zipfile.ZipFile(fileobj, 'w', compression, allowZip64=True)
+
+        with _ArchiveHandles(self.fopen) as handles:
+            for path, metadata in self.read_index_sorted(match_filter):
+                info = zipfile.ZipInfo(_path_str(path), time.localtime()[:6])
+                info.compress_type = compression
+                info.file_size = size = metadata[2] + metadata[5]
+
+                with self.get_vpkfile_instance(path, metadata, fopen=handles) as vpkfile:
+                    if sys.version_info >= (3, 6):
+                        with zipf.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as output:
+                            for chunk in iter(lambda: vpkfile.read(2**16), b''):
+                                output.write(chunk)
+                    else:
+                        zipf.writestr(info, vpkfile.read())
+
+        zipf.close()
+
+    def _make_vpkfile_path(self, metadata):
+        return _make_archive_path(self.vpk_path, metadata['archive_index'])
 
     def _make_meta_dict(self, metadata):
         return dict(zip(['preload',
@@ -346,7 +1411,7 @@ class VPK(object):
         """
         Reads VPK file header from the file
         """
-        with self.fopen(self.vpk_path, 'rb') as f:
+        with _traced_open(self.fopen, self.vpk_path) as f:
             (self.signature,
              self.version,
              self.tree_length
@@ -392,7 +1457,8 @@ class VPK(object):
 
     def calculate_checksums(self):
         """
-        Calculates MD5 checksums for file. Only for version 2
+        Calculates MD5 checksums for file. Only for version 2.
+        Number of bytes hashed and time taken are stored in ``checksum_stats``
 
         Note: individual files can be verified on both versions
         """
@@ -403,41 +1469,44 @@ class VPK(object):
         chunk_hashes_checksum = md5()
         file_checksum = md5()
 
-        def chunk_reader(length, chunk_size=2**14):
-            limit = f.tell() + length
-
-            while f.tell() < limit:
-                yield f.read(min(chunk_size, limit - f.tell()))
-
-        with self.fopen(self.vpk_path, 'rb') as f:
-            file_checksum.update(f.read(self.header_length))
-
-            for chunk in chunk_reader(self.tree_length):
-                file_checksum.update(chunk)
-                tree_checksum.update(chunk)
-
-            for chunk in chunk_reader(self.embed_chunk_length):
-                file_checksum.update(chunk)
+        start = time.time()
 
-            for chunk in chunk_reader(self.chunk_hashes_length):
-                file_checksum.update(chunk)
-                chunk_hashes_checksum.update(chunk)
+        with _traced_open(self.fopen, self.vpk_path) as f:
+            length = _hash_sections(f, [(self.header_length, [file_checksum]),
+                                        (self.tree_length, [file_checksum, tree_checksum]),
+                                        (self.embed_chunk_length, [file_checksum]),
+                                        (self.chunk_hashes_length, [file_checksum, chunk_hashes_checksum]),
+                                        (16*2, [file_checksum]),
+                                        ])
 
-            file_checksum.update(f.read(16*2))
+        self.checksum_stats = {'bytes': length, 'seconds': time.time() - start}
 
         return tree_checksum.digest(), chunk_hashes_checksum.digest(), file_checksum.digest()
 
-    def verify(self):
+    def verify(self, ledger=None, force=False):
         """
         Verify VPK file. Only for version 2
+
+        With a :class:`vpk.ledger.VerifyLedger`, the result is reused while
+        the file hasn't changed, unless ``force`` is set.
         """
+        if ledger is not None and not force:
+            result = ledger.get(*self._ledger_key())
+            if result is not None:
+                return result
+
         tree_checksum, chunk_hashes_checksum, file_checksum = self.calculate_checksums()
 
-        if (self.tree_checksum != tree_checksum
-           or self.chunk_hashes_checksum != chunk_hashes_checksum
-           or self.file_checksum != file_checksum):
-            return False
-        return True
+        result = (self.tree_checksum == tree_checksum
+                  and self.chunk_hashes_checksum == chunk_hashes_checksum
+                  and self.file_checksum == file_checksum)
+
+        if ledger is not None:
+            key, files = self._ledger_key()
+            ledger.set(key, files, result)
+            ledger.save()
+
+        return result
 
     def read_index(self):
         """
@@ -451,65 +1520,68 @@ class VPK(object):
         for path, metadata in self.read_index_iter():
             self.tree[path] = metadata
 
+        self._num_files = len(self.tree)
+
     def read_index_iter(self):
         """Generator function that reads the file index from the vpk file
 
         yeilds (file_path, metadata)
         """
-        _sblank, _sempty, _sdot, _ssep = ((' ', '', '.', '/')
-                                          if self.path_enc else
-                                          (b' ', b'', b'.', b'/'))
+        tracer = get_tracer()
+
+        if tracer is not None:
+            return tracer.time_iter(self._read_index_iter())
+        return self._read_index_iter()
 
-        with self.fopen(self.vpk_path, 'rb') as f:
+    def _read_tree(self):
+        """
+        Returns the raw directory tree
+        """
+        with _traced_open(self.fopen, self.vpk_path) as f:
             f.seek(self.header_length)
+            tree = f.read(self.tree_length)
 
-            while True:
-                if self.version > 0 and f.tell() > self.tree_length + self.header_length:
-                    raise ValueError("Error parsing index (out of bounds)")
+        if len(tree) < self.tree_length:
+            raise ValueError("Error parsing index (out of bounds)")
 
-                ext = _read_cstring(f, self.path_enc)
-                if not ext:
-                    break
+        return tree
 
-                while True:
-                    path = _read_cstring(f, self.path_enc)
-                    if not path:
-                        break
-                    if path != _sblank:
-                        path = path + _ssep
-                    else:
-                        path = _sempty
+    def _read_index_iter(self):
+        tree = self._read_tree()
+        data_offset = self.header_length + self.tree_length
 
-                    while True:
-                        name = _read_cstring(f, self.path_enc)
-                        if not name:
-                            break
+        for path, pos, metadata in _walk_tree(tree, self.path_enc):
+            (crc32,
+             preload_length,
+             archive_index,
+             archive_offset,
+             file_length,
+             ) = metadata
 
-                        (crc32,
+            if archive_index == 0x7fff:
+                archive_offset += data_offset
+
+            yield path, (tree[pos:pos + preload_length],
+                         crc32,
                          preload_length,
                          archive_index,
                          archive_offset,
                          file_length,
-                         suffix,
-                         ) = metadata = list(struct.unpack("IHHIIH", f.read(18)))
-
-                        if suffix != 0xffff:
-                            raise ValueError("Error while parsing index")
-
-                        if archive_index == 0x7fff:
-                            metadata[3] = self.header_length + self.tree_length + archive_offset
+                         )
 
-                        metadata = (f.read(preload_length),) + tuple(metadata[:-1])
 
-                        yield path + name + _sdot + ext, metadata
-
-
-class VPKFile(object):
+class VPKFile(io.RawIOBase):
     """
     File-like object for files inside VPK
+
+    Implements ``io.RawIOBase``, so it can be wrapped in ``io.BufferedReader``
+    or ``io.TextIOWrapper``. ``readline()``, ``readlines()`` and iteration go
+    through an internal ``io.BufferedReader`` of ``buffer_size`` bytes.
     """
     _fp = None
     _vpk_path = None
+    _reader = None
+    buffer_size = 2**13
 
     def __init__(self, vpk_path, fopen=fopen, **kw):
         self.vpk_path = vpk_path
@@ -524,11 +1596,11 @@ class VPKFile(object):
 
         # total file length
         self.length = self.preload_length + self.file_length
-        # offset of entire file
+        # offset of entire file, of the next unbuffered read
         self.offset = 0
 
         if vpk_path:
-            self._fp = self.fopen(vpk_path, 'rb')
+            self._fp = _traced_open(self.fopen, vpk_path)
             self._fp.seek(self.archive_offset)
 
     def save(self, path):
@@ -541,7 +1613,7 @@ class VPKFile(object):
 
         with fopen(path, 'wb') as output:
             output.truncate(self.length)
-            for chunk in iter(lambda: self.read(8192), b''):
+            for chunk in iter(lambda: self.read(2**16), b''):
                 output.write(chunk)
 
         self.seek(pos)
@@ -558,7 +1630,7 @@ class VPKFile(object):
         self.seek(0)
 
         checksum = 0
-        for chunk in iter(lambda: self.read(8192), b''):
+        for chunk in iter(lambda: self.read(2**16), b''):
             checksum = crc32(chunk, checksum)
 
         # restore file pointer
@@ -580,7 +1652,7 @@ class VPKFile(object):
         self.close()
 
     def __iter__(self):
-        return self
+        return iter(self._buffered())
 
     def __next__(self):
         return self.next()
@@ -592,13 +1664,56 @@ class VPKFile(object):
         return line
 
     def close(self):
+        self._reader = None
         if self._fp:
             self._fp.close()
+        super(VPKFile, self).close()
+
+    def _buffered(self):
+        """
+        Returns the internal buffered reader, reading ahead from the current offset
+        """
+        if self._reader is None:
+            self._reader = io.BufferedReader(_VPKFileRaw(self), self.buffer_size)
+        return self._reader
+
+    def _unbuffer(self):
+        """
+        Drops the internal buffered reader, moving back to the first byte not
+        yet returned from it, so reads from here on are unbuffered
+        """
+        if self._reader is not None:
+            offset = self._reader.tell()
+            self._reader = None
+            self._seek(offset)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
 
     def tell(self):
+        if self._reader is not None:
+            return self._reader.tell()
         return self.offset
 
     def seek(self, offset, whence=0):
+        if whence == 1:
+            offset = max(self.tell() + offset, 0)
+            whence = 0
+
+        # seeking within the buffered data doesn't touch the archive
+        if self._reader is not None and whence == 0 and offset >= 0:
+            return self._reader.seek(min(offset, self.length))
+
+        self._reader = None
+        return self._seek(offset, whence)
+
+    def _seek(self, offset, whence=0):
         if whence == 0:
             if offset < 0:
                 raise IOError("Invalid argument")
@@ -610,44 +1725,73 @@ class VPKFile(object):
             raise ValueError("Invalid value for whence")
 
         self.offset = offset = min(max(offset, 0), self.length)
-        self._fp.seek(self.archive_offset + max(offset - self.preload_length, 0))
-
-    def readlines(self):
-        return [line for line in self]
 
-    def readline(self, a=False):
-        buf = b''
+        if self._fp:
+            self._fp.seek(self.archive_offset + max(offset - self.preload_length, 0))
 
-        for chunk in iter(lambda: self.read(256), b''):
-            pos = chunk.find(b'\n')
-            if pos > -1:
-                pos += 1  # include \n
-                buf += chunk[:pos]
-                self.seek(-(len(chunk) - pos), 1)
-                break
+        return offset
 
-            buf += chunk
+    def readlines(self, hint=-1):
+        return self._buffered().readlines(-1 if hint is None else hint)
 
-        return buf
+    def readline(self, size=-1):
+        return self._buffered().readline(-1 if size is None else size)
 
     def read(self, length=-1):
-        if length == 0 or self.offset >= self.length:
+        self._unbuffer()
+        return self._read(length)
+
+    def _read(self, length=-1):
+        if length is None:
+            length = -1
+
+        pos = self.offset
+        left = self.length - pos
+        length = left if length < 0 else min(length, left)
+
+        if length <= 0:
             return b''
 
         data = b''
 
-        if self.offset <= self.preload_length:
-            data += self.preload[self.offset:self.offset+length if length > -1 else None]
-            self.offset += len(data)
-            if length > 0:
-                length = max(length - len(data), 0)
+        if pos < self.preload_length:
+            data = self.preload[pos:pos + length]
 
-        if self.file_length > 0 and self.offset >= self.preload_length:
-            left = self.file_length - (self.offset - self.preload_length)
-            data += self._fp.read(left if length == -1 else min(left, length))
-            self.offset += left if length == -1 else min(left, length)
+        if len(data) < length:
+            data += self._fp.read(length - len(data))
 
+        self.offset += len(data)
         return data
 
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
     def write(self, seq):
         raise NotImplementedError("write method is not supported")
+
+
+class _VPKFileRaw(io.RawIOBase):
+    """
+    Unbuffered view of a :class:`VPKFile`, for its internal buffered reader
+    """
+    def __init__(self, vpkfile):
+        self._vpkfile = vpkfile
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._vpkfile.offset
+
+    def seek(self, offset, whence=0):
+        return self._vpkfile._seek(offset, whence)
+
+    def readinto(self, b):
+        data = self._vpkfile._read(len(b))
+        b[:len(data)] = data
+        return len(data)
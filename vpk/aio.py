@@ -0,0 +1,187 @@
+"""
+asyncio interface for reading VPK files (Python 3.6+)
+
+Blocking file I/O runs on a bounded thread pool, using a pool of
+reusable file handles per archive, so the event loop is never blocked.
+
+.. code:: python
+
+    import vpk.aio
+
+    async with vpk.aio.open("pak01_dir.vpk") as pak:
+        data = await pak.read("scripts/emoticons.txt")
+
+        async for chunk in pak.stream("sounds/music.mp3", 2**16):
+            ...
+
+        datas = await pak.read_many(["a.txt", "b.txt"])
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import vpk
+
+
+def open(vpk_path, max_workers=8, max_concurrency=256, max_idle_handles=8, **kwargs):
+    """
+    Returns a AsyncVPK instance for specified path.
+    Remaining arguments are passed to :class:`vpk.VPK`
+    """
+    return AsyncVPK(vpk.VPK(vpk_path, **kwargs),
+                    max_workers=max_workers,
+                    max_concurrency=max_concurrency,
+                    max_idle_handles=max_idle_handles,
+                    )
+
+
+class _HandlePool(object):
+    """
+    Thread-safe pool of open file handles, keyed by archive path
+    """
+    def __init__(self, fopen, max_idle):
+        self.fopen = fopen
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, path):
+        with self._lock:
+            handles = self._idle.get(path)
+            if handles:
+                return handles.pop()
+
+        return self.fopen(path, 'rb')
+
+    def release(self, path, fp):
+        with self._lock:
+            handles = self._idle.setdefault(path, [])
+            if len(handles) < self.max_idle:
+                handles.append(fp)
+                return
+
+        fp.close()
+
+    def read(self, path, offset, length):
+        fp = self.acquire(path)
+        try:
+            fp.seek(offset)
+            return fp.read(length)
+        finally:
+            self.release(path, fp)
+
+    def close(self):
+        with self._lock:
+            for handles in self._idle.values():
+                for fp in handles:
+                    fp.close()
+            self._idle.clear()
+
+
+class AsyncVPK(object):
+    """
+    Async wrapper around a :class:`vpk.VPK` instance
+    """
+    def __init__(self, pak, max_workers=8, max_concurrency=256, max_idle_handles=8):
+        self.pak = pak
+        self.max_concurrency = max_concurrency
+
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._handles = _HandlePool(pak.fopen, max_idle_handles)
+        self._index_lock = threading.Lock()
+        self._index_ready = pak.tree is not None
+        self._semaphore = None
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, repr(self.pak))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        # waiting for the workers would block the loop
+        await asyncio.get_event_loop().run_in_executor(None, self.close)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._handles.close()
+
+    async def _run(self, func, *args):
+        # created lazily, so it binds to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    def _get_file_meta(self, path):
+        if not self._index_ready:
+            with self._index_lock:
+                if not self._index_ready:
+                    if self.pak.tree is None:
+                        self.pak.read_index()
+                    self._index_ready = True
+
+        metadata = self.pak.get_file_meta(path)
+        metadata['archive_path'] = self.pak._make_vpkfile_path(metadata)
+        return metadata
+
+    def _read(self, path):
+        metadata = self._get_file_meta(path)
+        data = metadata['preload']
+
+        if metadata['file_length'] > 0:
+            chunk = self._handles.read(metadata['archive_path'],
+                                       metadata['archive_offset'],
+                                       metadata['file_length'],
+                                       )
+            if len(chunk) != metadata['file_length']:
+                raise IOError("Unexpected end of archive: %s" % repr(metadata['archive_path']))
+
+            data += chunk
+        return data
+
+    async def get_file_meta(self, path):
+        """
+        Returns metadata for given file path
+        """
+        return await self._run(self._get_file_meta, path)
+
+    async def read(self, path):
+        """
+        Returns the entire contents of the file at path
+        """
+        return await self._run(self._read, path)
+
+    async def read_many(self, paths):
+        """
+        Returns a list with the contents of each path, in the same order
+        """
+        return await asyncio.gather(*[self.read(path) for path in paths])
+
+    async def stream(self, path, chunk_size=2**16):
+        """
+        Async generator yielding the contents of the file in chunks
+        """
+        metadata = await self.get_file_meta(path)
+
+        preload = metadata['preload']
+        for offset in range(0, len(preload), chunk_size):
+            yield preload[offset:offset + chunk_size]
+
+        offset = metadata['archive_offset']
+        left = metadata['file_length']
+
+        while left > 0:
+            chunk = await self._run(self._handles.read,
+                                    metadata['archive_path'],
+                                    offset,
+                                    min(chunk_size, left),
+                                    )
+            if not chunk:
+                raise IOError("Unexpected end of archive: %s" % repr(metadata['archive_path']))
+
+            offset += len(chunk)
+            left -= len(chunk)
+            yield chunk
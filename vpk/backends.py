@@ -0,0 +1,298 @@
+"""
+Storage backends for reading VPKs from remote or slow storage
+
+A backend only needs to implement ``read_range(name, offset, length)`` and
+``size(name)``. ``backend.open`` can then be passed as ``fopen`` to
+:class:`vpk.VPK`, where the VPK path and the archive paths derived from it are
+the names given to the backend.
+
+:class:`BlockCache` wraps any backend with a LRU cache of fixed size blocks,
+merging reads of adjacent missing blocks into one request and reading ahead,
+so small reads (headers, index, line by line reading) don't each turn into a request.
+
+.. code:: python
+
+    from vpk.backends import HTTPBackend, BlockCache
+
+    backend = BlockCache(HTTPBackend("http://assets.example.com/dota/"))
+    pak = vpk.open("pak01_dir.vpk", fopen=backend.open)
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+    from urllib.parse import quote, urljoin
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError
+    from urllib import quote
+    from urlparse import urljoin
+
+
+class Backend(object):
+    """
+    Interface for range reads from named files
+    """
+    def size(self, name):
+        """
+        Returns the size of the file
+        """
+        raise NotImplementedError
+
+    def read_range(self, name, offset, length):
+        """
+        Returns up to length bytes from offset, fewer only at the end of file
+        """
+        raise NotImplementedError
+
+    def open(self, name, mode='rb'):
+        """
+        Returns a read-only file-like object, usable as ``fopen`` for :class:`vpk.VPK`
+        """
+        if mode not in ('r', 'rb'):
+            raise ValueError("Backends are read-only: %s" % repr(mode))
+        return RangeFile(self, name)
+
+
+class RangeFile(io.RawIOBase):
+    """
+    File-like object doing range reads through a backend
+    """
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+        self._size = None
+        self._pos = 0
+
+    def __repr__(self):
+        return "%s(%s, %s)" % (self.__class__.__name__, repr(self.backend), repr(self.name))
+
+    @property
+    def size(self):
+        if self._size is None:
+            self._size = self.backend.size(self.name)
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            pos = offset
+        elif whence == 1:
+            pos = self._pos + offset
+        elif whence == 2:
+            pos = self.size + offset
+        else:
+            raise ValueError("Invalid value for whence")
+
+        if pos < 0:
+            raise IOError("Invalid argument")
+
+        self._pos = pos
+        return pos
+
+    def read(self, length=-1):
+        if length is None or length < 0:
+            length = max(self.size - self._pos, 0)
+        if length == 0:
+            return b''
+
+        data = self.backend.read_range(self.name, self._pos, length)
+        self._pos += len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class LocalBackend(Backend):
+    """
+    Files on the local file system, relative to root
+    """
+    def __init__(self, root=''):
+        self.root = root
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, repr(self.root))
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def size(self, name):
+        return os.path.getsize(self._path(name))
+
+    def read_range(self, name, offset, length):
+        with io.open(self._path(name), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+
+class HTTPBackend(Backend):
+    """
+    Files on a HTTP server supporting Range requests, relative to base_url.
+    ``requests`` counts the requests made.
+    """
+    def __init__(self, base_url, timeout=30, headers=None):
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.requests = 0
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, repr(self.base_url))
+
+    def _url(self, name):
+        return urljoin(self.base_url, quote(name.replace(os.sep, '/')))
+
+    def _request(self, name, method='GET', headers=None):
+        with self._lock:
+            self.requests += 1
+
+        req = Request(self._url(name), headers=dict(self.headers, **(headers or {})))
+        req.get_method = lambda: method
+        return urlopen(req, timeout=self.timeout)
+
+    def size(self, name):
+        if name not in self._sizes:
+            resp = self._request(name, 'HEAD')
+            try:
+                self._sizes[name] = int(resp.headers['Content-Length'])
+            finally:
+                resp.close()
+
+        return self._sizes[name]
+
+    def read_range(self, name, offset, length):
+        if length <= 0:
+            return b''
+
+        try:
+            resp = self._request(name, headers={'Range': 'bytes=%d-%d' % (offset, offset + length - 1)})
+        except HTTPError as exc:
+            # range starts past the end of file
+            if exc.code == 416:
+                return b''
+            raise
+
+        try:
+            data = resp.read()
+
+            # server ignored the Range header
+            if resp.getcode() == 200:
+                data = data[offset:offset + length]
+        finally:
+            resp.close()
+
+        return data
+
+
+class BlockCache(Backend):
+    """
+    LRU cache of ``block_size`` blocks over another backend, holding up to
+    ``max_blocks``. Adjacent missing blocks are fetched with one request,
+    extended by up to ``readahead`` blocks.
+    """
+    def __init__(self, backend, block_size=2**16, max_blocks=1024, readahead=4):
+        self.backend = backend
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.readahead = readahead
+
+        self.hits = 0
+        self.misses = 0
+
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "%s(%s, block_size=%d)" % (self.__class__.__name__, repr(self.backend), self.block_size)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def _fetch(self, name, first, last):
+        """
+        Fetches blocks first to last (inclusive) with one request,
+        returns dict of block index to data
+        """
+        bs = self.block_size
+        data = self.backend.read_range(name, first * bs, (last - first + 1) * bs)
+        blocks = dict((index, data[(index - first) * bs:(index - first + 1) * bs])
+                      for index in range(first, last + 1))
+
+        with self._lock:
+            for index, block in blocks.items():
+                self._blocks[(name, index)] = block
+
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+
+        return blocks
+
+    def read_range(self, name, offset, length):
+        if length <= 0:
+            return b''
+
+        bs = self.block_size
+        first = offset // bs
+        last = (offset + length - 1) // bs
+
+        blocks = {}
+        missing = []
+
+        with self._lock:
+            for index in range(first, last + 1):
+                block = self._blocks.pop((name, index), None)
+
+                if block is None:
+                    missing.append(index)
+                else:
+                    # move to the end, as most recently used
+                    self._blocks[(name, index)] = block
+                    blocks[index] = block
+
+            self.hits += len(blocks)
+            self.misses += len(missing)
+
+        # coalesce runs of missing blocks, read ahead after the last one.
+        # fetched blocks are kept here, in case a concurrent read evicts them
+        while missing:
+            start = end = missing.pop(0)
+            while missing and missing[0] == end + 1:
+                end = missing.pop(0)
+
+            if not missing:
+                with self._lock:
+                    for _ in range(self.readahead):
+                        if (name, end + 1) in self._blocks:
+                            break
+                        end += 1
+
+            blocks.update(self._fetch(name, start, end))
+
+        parts = []
+
+        for index in range(first, last + 1):
+            parts.append(blocks[index])
+
+            # end of file
+            if len(blocks[index]) < bs:
+                break
+
+        pos = offset - first * bs
+        return b''.join(parts)[pos:pos + length]
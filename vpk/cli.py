@@ -8,10 +8,17 @@ import re
 import sys
 from fnmatch import fnmatch
 import argparse
+import json
+from contextlib import contextmanager
 from binascii import hexlify
 import os
 
 import vpk
+import vpk.patch
+import vpk.server
+import vpk.tracing
+from vpk.ledger import VerifyLedger
+from vpk.progress import ProgressMeter
 
 def make_argparser():
     parser = argparse.ArgumentParser(description='Manage Valve Pak files')
@@ -19,7 +26,7 @@ def make_argparser():
     parser.add_argument('--version', action='version', version='%(prog)s ' + str(vpk.__version__))
 
     info = parser.add_argument_group('Main')
-    info.add_argument('file', type=str, help='Input VPK file')
+    info.add_argument('file', type=str, nargs='?', help='Input VPK file')
 
     excl = info.add_mutually_exclusive_group()
     excl.add_argument('-l', '--list', dest='list', action='store_true', help='List file paths')
@@ -28,9 +35,32 @@ def make_argparser():
     excl.add_argument('-c', '--create', metavar='DIR', type=str, help='Create VPK file from directory')
     excl.add_argument('-p', '--pipe', dest='pipe_output', action='store_true', help='Write file contents to stdout')
     excl.add_argument('-x', '--extract', dest='out_location', type=str, help='Extract files to directory')
+    excl.add_argument('--export-tar', metavar='OUT', type=str, help='Write files as tar archive (- for stdout)')
+    excl.add_argument('--export-zip', metavar='OUT', type=str, help='Write files as zip archive (- for stdout)')
+    excl.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), type=str, help='Show added, removed and changed files between two VPKs')
+    excl.add_argument('--stats', action='store_true', help='Show file and archive layout statistics')
+    excl.add_argument('--grep', metavar='PATTERN', type=str, help='Search file contents for regular expression')
+    excl.add_argument('--make-patch', nargs=3, metavar=('OLD', 'NEW', 'PATCH'), type=str, help='Create delta patch from OLD to NEW VPK')
+    excl.add_argument('--serve', nargs='+', metavar='DIR_OR_PAK', type=str, help='Serve files from VPKs over HTTP')
+    excl.add_argument('--apply-patch', nargs=3, metavar=('OLD', 'PATCH', 'OUT'), type=str, help='Apply delta patch to OLD VPK, writing OUT VPK')
 
     info.add_argument('-cv', '--create-version', dest='create_version', type=int, choices=(1,2), default=2, help='Create VPK with this version')
     info.add_argument('-nd', '--no-directories', dest='makedir', action='store_false', help="Don't create directries during extraction")
+    info.add_argument('--ledger', metavar='FILE', type=str, help='Skip verifying archives unchanged since last verified (for --test), check CRC of existing files (for --incremental)')
+    info.add_argument('--incremental', action='store_true', help='Skip files already extracted with the same size (for --extract)')
+    info.add_argument('--dedupe', choices=('hardlink', 'reflink'), help='Write files with the same contents once, and link the rest (for --extract)')
+    info.add_argument('--delete', action='store_true', help='Delete files in the output directory that were not extracted (for --extract)')
+    info.add_argument('--force', action='store_true', help='Verify everything, ignoring the ledger')
+    info.add_argument('--md5', action='store_true', help='Verify MD5 checksums (version 2 only)')
+    info.add_argument('--json', action='store_true', help='Output --stats as JSON')
+    info.add_argument('-F', '--fixed-strings', action='store_true', help='Treat --grep pattern as plain string')
+    info.add_argument('-j', '--workers', type=int, default=None, metavar='N', help='Number of parallel workers (default: CPU count)')
+    info.add_argument('--deep', action='store_true', help='Compare contents of files with matching CRC (for --diff)')
+    info.add_argument('--bind', metavar='ADDR', default='127.0.0.1', type=str, help='Address to serve on (default: 127.0.0.1)')
+    info.add_argument('--port', type=int, default=8080, help='Port to serve on (default: 8080)')
+    info.add_argument('-q', '--quiet', action='store_true', help="Don't print each file path (for --extract, --serve)")
+    info.add_argument('--progress-json', action='store_true', help='Write progress as JSON lines to stderr')
+    info.add_argument('--profile', action='store_true', help='Print I/O counters and timings to stderr')
     info.add_argument('-pe', '--path-encoding', dest='path_enc', default='utf-8', metavar='ENC', type=str, help='File paths encoding')
 
     filtr = parser.add_argument_group('Filters')
@@ -43,8 +73,9 @@ def make_argparser():
     return parser
 
 
-def print_header(pak):
-    num_files = len(pak)
+def print_header(pak, check_md5=False, num_files=None):
+    if num_files is None:
+        num_files = len(pak)
 
     print("% 20s"%"VPK File:", pak.vpk_path)
     print("% 20s"%"Version:", pak.version)
@@ -55,21 +86,82 @@ def print_header(pak):
         print("% 20s"%"Index size:", "{:,}".format(pak.tree_length))
 
     if pak.version == 2:
-        treesum, chunksum, filesum = pak.calculate_checksums()
+        def status(expected, actual):
+            if not check_md5:
+                return ""
+            return "(OK)" if expected == actual else "MISMATCH!"
+
+        treesum = chunksum = filesum = None
+
+        if check_md5:
+            treesum, chunksum, filesum = pak.calculate_checksums()
 
         treesum_hex = hexlify(pak.tree_checksum).decode('ascii')
         chunksum_hex = hexlify(pak.chunk_hashes_checksum).decode('ascii')
         filesum_hex = hexlify(pak.file_checksum).decode('ascii')
 
         print("% 20s"%"Embedded chunk size:", "{:,}".format(pak.embed_chunk_length))
-        print("% 20s"%"Tree MD5:", treesum_hex, "(OK)" if pak.tree_checksum == treesum else "MISMATCH!")
-        print("% 20s"%"Chunk hashes MD5:", chunksum_hex, "(OK)" if pak.chunk_hashes_checksum == chunksum else "MISMATCH!")
-        print("% 20s"%"File MD5:", filesum_hex, "(OK)" if pak.file_checksum == filesum else "MISMATCH!")
+        print("% 20s"%"Tree MD5:", treesum_hex, status(pak.tree_checksum, treesum))
+        print("% 20s"%"Chunk hashes MD5:", chunksum_hex, status(pak.chunk_hashes_checksum, chunksum))
+        print("% 20s"%"File MD5:", filesum_hex, status(pak.file_checksum, filesum))
+
+        if check_md5:
+            print("% 20s"%"MD5 throughput:", "{:,.1f} MB/s".format(
+                  pak.checksum_stats['bytes'] / max(pak.checksum_stats['seconds'], 1e-9) / 2**20))
+
         print("% 20s"%"Has signature:", "Yes" if pak.signature_length else "No")
 
     print("% 20s"%"Number of files:", "{:,}".format(num_files))
 
 
+def print_stats(pak, check_md5=False, as_json=False):
+    stats = pak.get_stats()
+
+    if as_json:
+        stats['archives'] = dict(("dir" if k == 0x7fff else str(k), v) for k, v in stats['archives'].items())
+
+        if check_md5 and pak.version == 2:
+            stats['checksums_ok'] = pak.verify()
+            stats['checksum_stats'] = pak.checksum_stats
+
+        print(json.dumps(stats, indent=2, sort_keys=True))
+        return
+
+    print_header(pak, check_md5, stats['files'])
+
+    print("% 20s"%"Total file size:", "{:,}".format(stats['bytes']))
+    print("% 20s"%"Preload size:", "{:,}".format(stats['preload_bytes']))
+
+    dups = stats['duplicates']
+    print("% 20s"%"Duplicates:", "{:,} groups, {:,} copies, {:,} bytes".format(
+          dups['groups'], dups['copies'], dups['wasted_bytes']))
+
+    loc = stats['locality']
+    print("% 20s"%"Archive switches:", "{:,}".format(loc['archive_switches']))
+    print("% 20s"%"Forward reads:", "{:,}".format(loc['forward_reads']))
+    print("% 20s"%"Backward reads:", "{:,}".format(loc['backward_reads']))
+    print("% 20s"%"Mean seek distance:", "{:,}".format(loc['mean_seek_distance']))
+
+    print("\n%20s %12s %16s" % ("Extension", "Files", "Bytes"))
+    for ext, ext_stats in sorted(stats['extensions'].items(), key=lambda x: -x[1]['bytes']):
+        print("%20s %12s %16s" % (ext, "{:,}".format(ext_stats['files']), "{:,}".format(ext_stats['bytes'])))
+
+    print("\n%20s %12s %16s %16s %16s %16s" % ("Archive", "Files", "Bytes", "Size", "Unused", "Overlap"))
+    for index, archive in sorted(stats['archives'].items()):
+        print("%20s %12s %16s %16s %16s %16s" % (
+              "dir" if index == 0x7fff else "%03d" % index,
+              "{:,}".format(archive['files']),
+              "{:,}".format(archive['bytes']),
+              "-" if archive['size'] is None else "{:,}".format(archive['size']),
+              "{:,}".format(archive['dead_bytes']),
+              "{:,}".format(archive['overlap_bytes']),
+              ))
+
+    print("\n%20s %12s" % ("File size from", "Files"))
+    for size, count in sorted(stats['size_histogram'].items()):
+        print("%20s %12s" % ("{:,}".format(size), "{:,}".format(count)))
+
+
 def make_filter_func(wildcard=None, name_wildcard=None, regex=None, invert=False):
     path_filter = None
 
@@ -87,7 +179,7 @@ def make_filter_func(wildcard=None, name_wildcard=None, regex=None, invert=False
 
 
 def print_file_list(pak, match_filter=None, include_details=False):
-    for path, metadata in pak.read_index_iter():
+    for path, metadata in pak.items():
         if match_filter and not match_filter(path):
             continue
 
@@ -100,59 +192,123 @@ def print_file_list(pak, match_filter=None, include_details=False):
             print(path)
 
 
-def print_verifcation(pak):
-    for path, metadata in pak.read_index_iter():
-        with pak.get_vpkfile_instance(path, metadata) as vpkfile:
-            ok = vpkfile.verify()
+@contextmanager
+def progress_reporting(quiet=False, as_json=False, on_file=None):
+    """
+    Yields a progress callback, which calls on_file(path) unless quiet.
+    Progress is written to stderr as JSON lines, or as a status line
+    when stderr is a terminal not shared with per file output.
+    """
+    meters = []
 
-            if not ok:
-                print("%s: FAILED" % path)
+    if as_json:
+        meters.append(ProgressMeter(sys.stderr, as_json=True))
+    elif sys.stderr.isatty() and (quiet or on_file is None or not sys.stdout.isatty()):
+        meters.append(ProgressMeter(sys.stderr))
 
+    def progress(done, total, path):
+        if on_file is not None and not quiet:
+            on_file(path)
+        for meter in meters:
+            meter(done, total, path)
 
-def mktree(path):
-    path, filename = os.path.split(path)
+    try:
+        yield progress
+    finally:
+        for meter in meters:
+            meter.close()
 
-    if not path:
-        return
 
-    if not os.path.isdir(path):
-        os.makedirs(path)
+def print_verifcation(pak, ledger_path=None, force=False, workers=None, progress_json=False):
+    ledger = VerifyLedger(ledger_path) if ledger_path else None
+
+    with progress_reporting(as_json=progress_json) as progress:
+        failed = pak.verify_entries(workers=workers, ledger=ledger, force=force, progress=progress)
+
+    for path in sorted(failed):
+        print("%s: FAILED" % path)
 
 
-def extract_files(pak, match_filter, outdir, makedir=False):
+def extract_files(pak, match_filter, outdir, makedir=False, quiet=False, progress_json=False,
+                  incremental=False, ledger_path=None, dedupe=None, delete=False):
     outdir = os.path.relpath(outdir)
+    ledger = VerifyLedger(ledger_path) if ledger_path else None
 
-    for path, metadata in pak.read_index_iter():
-        if match_filter and not match_filter(path):
-            continue
+    def on_file(path):
+        print(os.path.join(outdir, path if makedir else path.split('/')[-1]))
+
+    with progress_reporting(quiet, progress_json, on_file) as progress:
+        stats = pak.extract(outdir, match_filter, makedir, progress=progress,
+                            incremental=incremental, ledger=ledger, dedupe=dedupe, delete=delete)
+
+    if incremental or dedupe or delete:
+        print("{written:,} written, {skipped:,} skipped, {linked:,} linked, {deleted:,} deleted".format(**stats))
 
-        with pak.get_vpkfile_instance(path, metadata) as vpkfile:
-            if makedir:
-                outpath = os.path.join(outdir, path)
-            else:
-                outpath = os.path.join(outdir, os.path.split(path)[1])
 
-            mktree(outpath)
+def get_stdout_binary():
+    try:
+        return sys.stdout.buffer
+    except AttributeError:
+        return sys.stdout
+
 
-            vpkfile.save(outpath)
+def export_files(pak, match_filter, out_path, fmt):
+    export = pak.export_tar if fmt == 'tar' else pak.export_zip
 
-            print(outpath)
+    if out_path == '-':
+        export(get_stdout_binary(), match_filter)
+    else:
+        with open(out_path, 'wb') as output:
+            export(output, match_filter)
 
 
 def pipe_files(pak, match_filter):
-    for filepath in pak:
+    _out = get_stdout_binary()
+
+    for filepath, metadata in pak.items():
         if match_filter and not match_filter(filepath):
             continue
 
-        vfp = pak.get_file(filepath)
+        with pak.get_vpkfile_instance(filepath, metadata) as vfp:
+            for chunk in iter(lambda: vfp.read(2**16), b''):
+                _out.write(chunk)
 
-        try:
-            _out = sys.stdout.buffer
-        except AttributeError:
-            _out = sys.stdout
 
-        for chunk in iter(lambda: vfp.read(8192), b''):
-            _out.write(chunk)
+def print_diff(old_path, new_path, match_filter=None, deep=False, path_enc='utf-8', workers=None):
+    result = vpk.diff(vpk.open(old_path, path_enc=path_enc),
+                      vpk.open(new_path, path_enc=path_enc),
+                      deep=deep,
+                      workers=workers,
+                      match_filter=match_filter,
+                      )
+
+    for status, key in (('A', 'added'), ('D', 'removed'), ('M', 'changed')):
+        for path in result[key]:
+            print(status, path)
+
+    return result
+
+
+def print_search(pak, pattern, match_filter=None, fixed_strings=False, workers=None):
+    pattern = pattern.encode('utf-8')
+
+    if not fixed_strings:
+        pattern = re.compile(pattern)
+
+    for path, offset in pak.search(pattern, match_filter, workers):
+        print("%s:%d" % (path, offset))
+
+
+def make_patch(old_path, new_path, patch_path):
+    stats = vpk.patch.make_patch(old_path, new_path, patch_path)
+
+    print("% 20s"%"Copied from old:", "{:,}".format(stats['copied']))
+    print("% 20s"%"Patch data:", "{:,}".format(stats['data']))
+
+
+def apply_patch(old_path, patch_path, out_path):
+    pak = vpk.patch.apply_patch(old_path, patch_path, out_path)
+    print(pak.vpk_path)
 
 
 def create_vpk(args):
@@ -163,7 +319,50 @@ def create_vpk(args):
 
     new_vpk = vpk.new(args.create, path_enc=args.path_enc)
     new_vpk.version = args.create_version
-    new_vpk.save(args.file)
+
+    if not args.progress_json:
+        new_vpk.save(args.file)
+        return
+
+    with progress_reporting(as_json=True) as progress:
+        new_vpk.save(args.file, progress=progress)
+
+
+def print_profile(tracer, seconds):
+    stats = tracer.stats()
+    out = sys.stderr
+
+    print("% 20s"%"Total time:", "{:.3f}s".format(seconds), file=out)
+    print("% 20s"%"Index parse time:", "{:.3f}s ({:,} parses)".format(
+          stats['index_parse_seconds'], stats['index_parses']), file=out)
+    print("% 20s"%"Opens:", "{:,}".format(stats['opens']), file=out)
+    print("% 20s"%"Seeks:", "{:,}".format(stats['seeks']), file=out)
+    print("% 20s"%"Reads:", "{:,}".format(stats['reads']), file=out)
+    print("% 20s"%"Bytes read:", "{:,}".format(stats['bytes_read']), file=out)
+    print("% 20s"%"Cache hits:", "{:,} ({:,} misses)".format(
+          stats['cache_hits'], stats['cache_misses']), file=out)
+
+    print("\n%40s %8s %8s %10s %16s" % ("File", "Opens", "Seeks", "Reads", "Bytes"), file=out)
+    for path, counters in sorted(stats['files'].items()):
+        print("%40s %8s %8s %10s %16s" % (
+              os.path.basename(path),
+              "{:,}".format(counters['opens']),
+              "{:,}".format(counters['seeks']),
+              "{:,}".format(counters['reads']),
+              "{:,}".format(counters['bytes_read']),
+              ), file=out)
+
+
+def serve(paths, host, port, path_enc='utf-8', verbose=True):
+    server = vpk.server.AssetServer((host, port), vpk.server.open_paks(paths, path_enc=path_enc), verbose)
+
+    print("Serving {:,} files from {:,} VPKs on http://{}:{}/".format(
+          len(server.resolver), len(server.resolver.paks), host, server.server_address[1]))
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
 
 
 def run(args):
@@ -171,27 +370,49 @@ def run(args):
         create_vpk(args)
         return
 
-    pak = vpk.open(args.file, path_enc=args.path_enc)
-
     path_filter = make_filter_func(args.filter, args.filter_name, args.regex, args.invert_match)
 
+    if args.diff:
+        print_diff(args.diff[0], args.diff[1], path_filter, args.deep, args.path_enc, args.workers)
+        return
+    if args.make_patch:
+        make_patch(*args.make_patch)
+        return
+    if args.apply_patch:
+        apply_patch(*args.apply_patch)
+        return
+    if args.serve:
+        serve(args.serve, args.bind, args.port, args.path_enc, not args.quiet)
+        return
+
+    pak = vpk.open(args.file, path_enc=args.path_enc)
+
     if args.list or args.listall:
         print_file_list(pak, path_filter, args.listall)
     elif args.pipe_output:
         pipe_files(pak, path_filter)
     elif args.test:
-        print_verifcation(pak)
+        print_verifcation(pak, args.ledger, args.force, args.workers, args.progress_json)
     elif args.out_location:
-        extract_files(pak, path_filter, args.out_location, args.makedir)
+        extract_files(pak, path_filter, args.out_location, args.makedir, args.quiet, args.progress_json,
+                      args.incremental, args.ledger, args.dedupe, args.delete)
+    elif args.grep:
+        print_search(pak, args.grep, path_filter, args.fixed_strings, args.workers)
+    elif args.export_tar:
+        export_files(pak, path_filter, args.export_tar, 'tar')
+    elif args.export_zip:
+        export_files(pak, path_filter, args.export_zip, 'zip')
+    elif args.stats:
+        print_stats(pak, args.md5, args.json)
     else:
-        print_header(pak)
+        print_header(pak, args.md5)
 
 
 def main():
     parser = make_argparser()
     args = parser.parse_args()
 
-    if not sys.argv or not args.file:
+    if not sys.argv or not (args.file or args.diff or args.make_patch or args.apply_patch or args.serve):
         parser.print_help()
         return
 
@@ -203,6 +424,15 @@ def main():
         print("--invert-match/-v requires one of --filter, --name or --regex")
         return
 
+    if args.grep and not args.fixed_strings:
+        try:
+            re.compile(args.grep.encode('utf-8'))
+        except re.error as e:
+            parser.error("invalid --grep pattern: %s" % e)
+
+    tracer = vpk.tracing.enable() if args.profile else None
+    start = vpk.tracing.timer()
+
     try:
         run(args)
     except ValueError as e:
@@ -211,6 +441,10 @@ def main():
         print("IOError:", str(e))
     except KeyboardInterrupt:
         pass
+    finally:
+        if tracer is not None:
+            vpk.tracing.disable()
+            print_profile(tracer, vpk.tracing.timer() - start)
 
 
 if __name__ == '__main__':
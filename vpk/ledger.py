@@ -0,0 +1,104 @@
+"""
+Verification ledger, remembering results of integrity checks
+
+Results are keyed by the size, mtime and inode of the checked files,
+so repeated checks only verify files that have changed since.
+
+.. code:: python
+
+    from vpk.ledger import VerifyLedger
+
+    ledger = VerifyLedger("/var/cache/vpk-ledger.json")
+
+    pak = vpk.open("pak01_dir.vpk")
+    pak.verify(ledger=ledger)
+    failed = pak.verify_entries(ledger=ledger)
+"""
+
+import json
+import os
+from io import open as fopen
+
+
+def file_signature(*paths):
+    """
+    Returns a list of (size, mtime, inode) for the given files
+    """
+    signature = []
+
+    for path in paths:
+        st = os.stat(path)
+        signature.append([st.st_size,
+                          getattr(st, 'st_mtime_ns', int(st.st_mtime * 1e9)),
+                          st.st_ino,
+                          ])
+
+    return signature
+
+
+class VerifyLedger(object):
+    """
+    Stores verification results in a JSON file at path. With path None
+    results are only kept in memory.
+    """
+    version = 1
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+
+        if path and os.path.exists(path):
+            self.load()
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, repr(self.path))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        with fopen(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        # results from other versions are not trusted
+        self.entries = data.get('entries', {}) if data.get('version') == self.version else {}
+
+    def save(self):
+        if not self.path:
+            return
+
+        tmp_path = self.path + '.tmp'
+
+        with fopen(tmp_path, 'wb') as f:
+            f.write(json.dumps({'version': self.version, 'entries': self.entries}).encode('utf-8'))
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
+
+    def get(self, key, files):
+        """
+        Returns the recorded result for key, or None when there isn't one
+        or any of the files have changed since it was recorded
+        """
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        try:
+            if entry['signature'] != file_signature(*files):
+                return None
+        except OSError:
+            return None
+
+        return entry['result']
+
+    def set(self, key, files, result):
+        """
+        Records result for key, along with the current signature of the files
+        """
+        self.entries[key] = {'signature': file_signature(*files), 'result': result}
+
+    def discard(self, key):
+        self.entries.pop(key, None)
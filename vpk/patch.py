@@ -0,0 +1,244 @@
+"""
+Delta patches between two versions of a VPK
+
+A patch describes every file of the new VPK (the _dir.vpk and each archive)
+as a list of operations. Byte ranges of files whose CRC32 and size match a
+file in the old VPK are copied from the old archives, everything else
+(headers, the tree, changed files, gaps) is stored in the patch.
+
+Patch layout::
+
+    b"VPKPATCH", uint32 version, uint32 manifest length, JSON manifest, data
+
+.. code:: python
+
+    import vpk.patch
+
+    vpk.patch.make_patch("old/pak01_dir.vpk", "new/pak01_dir.vpk", "update.vpkpatch")
+    vpk.patch.apply_patch("old/pak01_dir.vpk", "update.vpkpatch", "out/pak01_dir.vpk")
+"""
+
+import json
+import os
+import struct
+from hashlib import md5
+from io import open as fopen
+
+import vpk
+from vpk import _make_archive_path
+
+MAGIC = b"VPKPATCH"
+VERSION = 1
+
+OP_DATA = 0
+OP_COPY = 1
+
+
+def _iter_range(f, offset, length, chunk_size=2**20):
+    f.seek(offset)
+
+    while length > 0:
+        chunk = f.read(min(chunk_size, length))
+        if not chunk:
+            raise IOError("Unexpected end of file: %s" % repr(f.name))
+        length -= len(chunk)
+        yield chunk
+
+
+def _file_md5(path, chunk_size=2**20):
+    checksum = md5()
+
+    with fopen(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            checksum.update(chunk)
+
+    return checksum.hexdigest()
+
+
+def _append_op(ops, op):
+    """
+    Appends op, merging it with the previous one when the ranges are adjacent
+    """
+    if ops:
+        last = ops[-1]
+
+        if last[0] == op[0] == OP_DATA and last[1] + last[2] == op[1]:
+            last[2] += op[2]
+            return
+        if (last[0] == op[0] == OP_COPY
+           and last[1] == op[1]
+           and last[2] + last[3] == op[2]):
+            last[3] += op[3]
+            return
+
+    ops.append(op)
+
+
+def _make_file_ops(size, entries, blob_offset):
+    """
+    Returns list of ops and list of (offset, length) data ranges for a new file
+
+    entries is a list of (archive_offset, length, old_range or None)
+    """
+    ops = []
+    data = []
+    cursor = 0
+    blob = {'offset': blob_offset}
+
+    def add_data(offset, length):
+        if length > 0:
+            _append_op(ops, [OP_DATA, blob['offset'], length])
+            data.append((offset, length))
+            blob['offset'] += length
+
+    for offset, length, old_range in sorted(entries, key=lambda entry: entry[:2]):
+        # overlapping entries are already covered
+        if offset < cursor:
+            continue
+
+        add_data(cursor, offset - cursor)
+
+        if old_range is None:
+            add_data(offset, length)
+        else:
+            _append_op(ops, [OP_COPY, old_range[0], old_range[1], length])
+
+        cursor = offset + length
+
+    add_data(cursor, size - cursor)
+
+    return ops, data
+
+
+def make_patch(old_path, new_path, patch_path):
+    """
+    Writes a patch that turns the VPK at old_path into the one at new_path
+
+    Returns dict with the number of bytes ``copied`` from old and stored as ``data``
+    """
+    old = vpk.open(old_path, path_enc=None)
+    new = vpk.open(new_path, path_enc=None)
+
+    old_ranges = {}
+    for _, metadata in old.read_index_iter():
+        preload, crc32, _, archive_index, archive_offset, file_length = metadata
+        if file_length > 0:
+            old_ranges.setdefault((crc32, preload, file_length), (archive_index, archive_offset))
+
+    archives = {0x7fff: []}
+    for _, metadata in new.read_index_iter():
+        preload, crc32, _, archive_index, archive_offset, file_length = metadata
+        if file_length > 0:
+            archives.setdefault(archive_index, []).append(
+                (archive_offset, file_length, old_ranges.get((crc32, preload, file_length))))
+
+    manifest = {'files': []}
+    data_ranges = []
+    blob_length = 0
+    copied = 0
+
+    for archive_index in sorted(archives):
+        path = _make_archive_path(new_path, archive_index)
+        size = os.path.getsize(path)
+
+        ops, data = _make_file_ops(size, archives[archive_index], blob_length)
+
+        manifest['files'].append({'archive_index': archive_index,
+                                  'size': size,
+                                  'md5': _file_md5(path),
+                                  'ops': ops,
+                                  })
+        data_ranges.append((path, data))
+        blob_length += sum(length for _, length in data)
+        copied += sum(op[3] for op in ops if op[0] == OP_COPY)
+
+    manifest = json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+
+    with fopen(patch_path, 'wb') as output:
+        output.write(MAGIC + struct.pack("<II", VERSION, len(manifest)))
+        output.write(manifest)
+
+        for path, data in data_ranges:
+            with fopen(path, 'rb') as f:
+                for offset, length in data:
+                    for chunk in _iter_range(f, offset, length):
+                        output.write(chunk)
+
+    return {'copied': copied, 'data': blob_length}
+
+
+def read_manifest(patch_path):
+    """
+    Returns the manifest and data offset of a patch file
+    """
+    with fopen(patch_path, 'rb') as f:
+        header = f.read(len(MAGIC) + 8)
+
+        if len(header) < len(MAGIC) + 8 or header[:len(MAGIC)] != MAGIC:
+            raise ValueError("File is not VPK patch (invalid magic)")
+
+        version, manifest_length = struct.unpack("<II", header[len(MAGIC):])
+
+        if version != VERSION:
+            raise ValueError("Unsupported patch version: %d" % version)
+
+        manifest = json.loads(f.read(manifest_length).decode('utf-8'))
+
+        return manifest, f.tell()
+
+
+def apply_patch(old_path, patch_path, out_path):
+    """
+    Applies a patch to the VPK at old_path, writing the new VPK at out_path.
+    Archives are written next to it, named after out_path, which has to end
+    in ``_dir.vpk`` when the new VPK has archives.
+
+    Every written file is checked against the MD5 in the patch, and for
+    version 2 VPKs the checksums in the header are verified.
+
+    Returns a VPK instance of the new VPK
+    """
+    manifest, data_offset = read_manifest(patch_path)
+    old_files = {}
+
+    if os.path.realpath(out_path) == os.path.realpath(old_path):
+        raise ValueError("Output path can't be the VPK being patched: %s" % repr(out_path))
+    if (any(entry['archive_index'] != 0x7fff for entry in manifest['files'])
+            and not out_path.endswith('_dir.vpk')):
+        raise ValueError("Output path should end in _dir.vpk for a VPK with archives: %s" % repr(out_path))
+
+    try:
+        with fopen(patch_path, 'rb') as patch:
+            for entry in manifest['files']:
+                path = _make_archive_path(out_path, entry['archive_index'])
+                checksum = md5()
+                size = 0
+
+                with fopen(path, 'wb') as output:
+                    for op in entry['ops']:
+                        if op[0] == OP_DATA:
+                            chunks = _iter_range(patch, data_offset + op[1], op[2])
+                        elif op[0] == OP_COPY:
+                            if op[1] not in old_files:
+                                old_files[op[1]] = fopen(_make_archive_path(old_path, op[1]), 'rb')
+                            chunks = _iter_range(old_files[op[1]], op[2], op[3])
+                        else:
+                            raise ValueError("Invalid patch operation: %d" % op[0])
+
+                        for chunk in chunks:
+                            checksum.update(chunk)
+                            output.write(chunk)
+                            size += len(chunk)
+
+                if size != entry['size'] or checksum.hexdigest() != entry['md5']:
+                    raise ValueError("Patch verification failed for %s" % repr(path))
+    finally:
+        for f in old_files.values():
+            f.close()
+
+    pak = vpk.open(out_path)
+
+    if pak.version == 2 and not pak.verify():
+        raise ValueError("VPK checksum mismatch after patching: %s" % repr(out_path))
+
+    return pak
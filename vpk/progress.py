@@ -0,0 +1,106 @@
+"""
+Progress reporting for long running operations
+
+:meth:`vpk.VPK.extract`, :meth:`vpk.VPK.verify_entries` and :meth:`vpk.NewVPK.save`
+take a ``progress(done, total, path)`` callback, called after each file with
+the number of bytes done so far and in total. :class:`ProgressMeter` is such a
+callback, which shows the percentage done, throughput and ETA.
+
+.. code:: python
+
+    from vpk.progress import ProgressMeter
+
+    meter = ProgressMeter(sys.stderr)
+    pak.extract("out", progress=meter)
+    meter.close()
+"""
+
+from __future__ import division
+import json
+import sys
+import time
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--:--"
+
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class ProgressMeter(object):
+    """
+    Progress callback writing a status line to stream, or a JSON object per
+    line with ``as_json``. Updates are written at most every ``interval`` seconds,
+    and once more for the last file.
+    """
+    def __init__(self, stream=None, as_json=False, interval=0.5):
+        self.stream = stream or sys.stderr
+        self.as_json = as_json
+        self.interval = interval
+
+        self.done = 0
+        self.total = 0
+        self.path = None
+        self.start = timer()
+
+        self._last_write = None
+        self._written = False
+
+    def __call__(self, done, total, path):
+        self.done = done
+        self.total = total
+        self.path = path
+
+        now = timer()
+
+        if done < total and self._last_write is not None and now - self._last_write < self.interval:
+            return
+
+        self._last_write = now
+        self.write()
+
+    def status(self):
+        """
+        Returns dict with bytes ``done`` and ``total``, ``elapsed`` seconds,
+        ``mb_per_sec`` and ``eta`` in seconds (None until there is a rate)
+        """
+        elapsed = timer() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0
+
+        return {'done': self.done,
+                'total': self.total,
+                'path': self.path if self.path is None or not isinstance(self.path, bytes)
+                        else self.path.decode('utf-8', 'replace'),
+                'elapsed': elapsed,
+                'mb_per_sec': rate / 2**20,
+                'eta': (self.total - self.done) / rate if rate > 0 else None,
+                }
+
+    def write(self):
+        status = self.status()
+        self._written = True
+
+        if self.as_json:
+            self.stream.write(json.dumps(status, sort_keys=True) + "\n")
+        else:
+            self.stream.write("\r%5.1f%%  %s / %s MB  %.1f MB/s  ETA %s " % (
+                status['done'] * 100 / status['total'] if status['total'] else 100.0,
+                "{:,.1f}".format(status['done'] / 2**20),
+                "{:,.1f}".format(status['total'] / 2**20),
+                status['mb_per_sec'],
+                format_eta(status['eta']),
+                ))
+
+        self.stream.flush()
+
+    def close(self):
+        """
+        Ends the status line
+        """
+        if self._written and not self.as_json:
+            self.stream.write("\n")
+            self.stream.flush()
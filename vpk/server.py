@@ -0,0 +1,317 @@
+"""
+HTTP server for files in VPKs
+
+URL paths map to file paths in the VPKs, the first VPK having a path wins.
+Range requests, ``HEAD`` and conditional requests on the ``ETag`` (from CRC32
+and size) are answered from the index. Preload data is served from memory,
+while archive data is sent with ``os.sendfile`` where available.
+
+.. code:: python
+
+    import vpk.server
+
+    server = vpk.server.AssetServer(('127.0.0.1', 8080), vpk.server.open_paks(["pak01_dir.vpk"]))
+    server.serve_forever()
+
+:func:`make_wsgi_app` gives a WSGI application, and :meth:`AssetResolver.resolve`
+can be used to answer requests in other frameworks.
+"""
+
+import io
+import mimetypes
+import os
+import re
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from http.client import responses
+    from socketserver import ThreadingMixIn
+    from urllib.parse import unquote
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from httplib import responses
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+
+import vpk
+from vpk import _make_archive_path
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def open_paks(paths, **kwargs):
+    """
+    Returns list of :class:`vpk.VPK` for the given VPK paths, where a directory
+    stands for all VPKs in it (except numbered archives), in sorted order
+    """
+    paks = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path)
+                           if name.endswith('.vpk') and not re.search(r'_\d{3}\.vpk$', name))
+            paks.extend(vpk.open(os.path.join(path, name), **kwargs) for name in names)
+        else:
+            paks.append(vpk.open(path, **kwargs))
+
+    return paks
+
+
+def parse_range(value, size):
+    """
+    Returns (start, end) of a single byte range (end exclusive), None for
+    ranges that can't be satisfied, or False when the header should be ignored
+    """
+    match = _range_re.match(value.replace(' ', ''))
+
+    # multiple or malformed ranges, send the whole file instead
+    if not match or match.groups() == ('', ''):
+        return False
+
+    first, last = match.groups()
+
+    if not first:
+        start = max(size - int(last), 0)
+        end = size if int(last) > 0 else 0
+    else:
+        # last before first is invalid syntax (RFC 7233 2.1), not an unsatisfiable range
+        if last and int(last) < int(first):
+            return False
+
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+
+    if start >= end:
+        return None
+
+    return start, end
+
+
+class Response(object):
+    """
+    Response to a request. The content is ``body`` followed by
+    ``file_range``, a (path, offset, length) tuple or None
+    """
+    def __init__(self, status, headers=None, body=b'', file_range=None):
+        self.status = status
+        self.headers = headers or []
+        self.body = body
+        self.file_range = file_range
+
+    def __repr__(self):
+        return "%s(%d)" % (self.__class__.__name__, self.status)
+
+    @property
+    def status_line(self):
+        return "%d %s" % (self.status, responses.get(self.status, ''))
+
+    def iter_content(self, chunk_size=2**16):
+        """
+        Generator function yielding the content
+        """
+        if self.body:
+            yield self.body
+
+        if self.file_range is not None:
+            path, offset, length = self.file_range
+
+            with io.open(path, 'rb') as f:
+                f.seek(offset)
+
+                while length > 0:
+                    chunk = f.read(min(chunk_size, length))
+                    if not chunk:
+                        raise IOError("Unexpected end of file: %s" % repr(path))
+                    length -= len(chunk)
+                    yield chunk
+
+
+def _error(status, headers=None):
+    body = ("%d %s\n" % (status, responses.get(status, ''))).encode('ascii')
+    return Response(status,
+                    [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))] + (headers or []),
+                    body)
+
+
+class AssetResolver(object):
+    """
+    Maps file paths to entries of the given VPKs
+    """
+    def __init__(self, paks):
+        self.paks = list(paks)
+        self.entries = {}
+
+        for pak in self.paks:
+            for path, metadata in pak.items():
+                if path not in self.entries:
+                    self.entries[path] = (pak, metadata)
+
+    def __repr__(self):
+        return "%s(%d paks, %d files)" % (self.__class__.__name__, len(self.paks), len(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def resolve(self, path, method='GET', headers=None):
+        """
+        Returns :class:`Response` for a request of path (already unquoted),
+        where headers is a mapping with the request headers
+        """
+        headers = headers or {}
+
+        if method not in ('GET', 'HEAD'):
+            return _error(405, [('Allow', 'GET, HEAD')])
+
+        entry = self.entries.get(path.split('?', 1)[0].lstrip('/'))
+
+        if entry is None:
+            return _error(404)
+
+        pak, metadata = entry
+        preload, crc32, preload_length, archive_index, archive_offset, file_length = metadata
+        size = preload_length + file_length
+        etag = '"%08x-%x"' % (crc32, size)
+
+        response_headers = [('ETag', etag), ('Accept-Ranges', 'bytes')]
+
+        tags = [tag.strip() for tag in (headers.get('If-None-Match') or '').split(',')]
+        if '*' in tags or etag in tags:
+            return Response(304, response_headers)
+
+        start, end = 0, size
+        status = 200
+        value = headers.get('Range')
+
+        if value and headers.get('If-Range', etag) == etag:
+            byte_range = parse_range(value, size)
+
+            if byte_range is None:
+                return _error(416, [('Content-Range', 'bytes */%d' % size)])
+            if byte_range:
+                start, end = byte_range
+                status = 206
+                response_headers.append(('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, size)))
+
+        response_headers.append(('Content-Type', mimetypes.guess_type(path)[0] or 'application/octet-stream'))
+        response_headers.append(('Content-Length', str(end - start)))
+
+        if method == 'HEAD':
+            return Response(status, response_headers)
+
+        body = preload[start:end]
+        file_range = None
+        file_start = max(start - preload_length, 0)
+        file_end = end - preload_length
+
+        if file_end > file_start:
+            file_range = (_make_archive_path(pak.vpk_path, archive_index),
+                          archive_offset + file_start,
+                          file_end - file_start,
+                          )
+
+        return Response(status, response_headers, body, file_range)
+
+
+def make_wsgi_app(resolver):
+    """
+    Returns WSGI application serving files from an :class:`AssetResolver`
+    """
+    def app(environ, start_response):
+        path = environ.get('PATH_INFO', '')
+
+        # WSGI passes the path bytes as latin-1
+        if not isinstance(path, bytes):
+            path = path.encode('latin-1')
+        path = path.decode('utf-8', 'replace')
+
+        headers = dict((key[5:].replace('_', '-').title(), value)
+                       for key, value in environ.items() if key.startswith('HTTP_'))
+
+        response = resolver.resolve(path, environ['REQUEST_METHOD'], headers)
+        start_response(response.status_line, response.headers)
+
+        return response.iter_content()
+
+    return app
+
+
+class AssetRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, *args)
+
+    def do_GET(self):
+        path = unquote(self.path)
+        if isinstance(path, bytes):
+            path = path.decode('utf-8')
+
+        response = self.server.resolver.resolve(path, self.command, self.headers)
+
+        self.send_response(response.status)
+        for name, value in response.headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+        if self.command == 'HEAD':
+            return
+        if self.command != 'GET':
+            # the request body wasn't read
+            self.close_connection = True
+
+        if response.body:
+            self.wfile.write(response.body)
+        if response.file_range is not None:
+            self.server.send_file_range(self.wfile, self.connection, *response.file_range)
+
+    do_HEAD = do_GET
+    do_POST = do_PUT = do_DELETE = do_GET
+
+
+class AssetServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server for files in the given VPKs, see :class:`AssetResolver`
+    """
+    daemon_threads = True
+
+    def __init__(self, address, paks, verbose=False):
+        HTTPServer.__init__(self, address, AssetRequestHandler)
+        self.resolver = AssetResolver(paks)
+        self.verbose = verbose
+        self.use_sendfile = hasattr(os, 'sendfile')
+
+        self._fds = {}
+        self._lock = threading.Lock()
+
+    def _get_fd(self, path):
+        # sendfile doesn't use the file position, so descriptors are shared between threads
+        with self._lock:
+            if path not in self._fds:
+                self._fds[path] = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+            return self._fds[path]
+
+    def send_file_range(self, wfile, sock, path, offset, length):
+        if self.use_sendfile:
+            fd = self._get_fd(path)
+            wfile.flush()
+
+            while length > 0:
+                sent = os.sendfile(sock.fileno(), fd, offset, length)
+                if sent == 0:
+                    raise IOError("Unexpected end of file: %s" % repr(path))
+                offset += sent
+                length -= sent
+            return
+
+        for chunk in Response(200, file_range=(path, offset, length)).iter_content():
+            wfile.write(chunk)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+
+        with self._lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
@@ -0,0 +1,298 @@
+"""
+Index in shared memory, for sharing one copy between processes
+
+:class:`SharedIndex` stores the index of a VPK in a flat binary layout, in
+a ``multiprocessing.shared_memory`` segment or a memory mapped file. It is a
+read-only mapping with the same items as ``VPK.tree``, but doesn't hold a
+Python object per entry, so pages stay shared after ``fork()``. Other
+processes attach to it by its handle, and a :class:`vpk.VPK` using it is
+pickled with just the handle.
+
+.. code:: python
+
+    pak = vpk.open("pak01_dir.vpk")
+    index = pak.share_index()  # or pak.share_index("/dev/shm/pak01.index")
+
+    with ProcessPoolExecutor() as executor:
+        executor.map(job, [pak] * 100)
+
+    index.unlink()
+
+Layout::
+
+    header: b"VPKINDEX", uint32 version, uint32 count, uint32 table size, 16s path encoding
+    records: count * (path offset, preload offset, crc32, archive offset,
+                      file length, uint16 path length, preload length, archive index)
+             sorted by path
+    table: table size * uint32 record number, open addressing on CRC32 of the path
+    data: paths and preload data
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from binascii import crc32
+from io import open as fopen
+
+try:
+    from collections.abc import ItemsView, Mapping
+except ImportError:
+    from collections import ItemsView, Mapping
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    resource_tracker = shared_memory = None
+
+MAGIC = b"VPKINDEX"
+VERSION = 1
+
+_header_struct = struct.Struct("<8sIII16s")
+_record_struct = struct.Struct("<IIIIIHHH2x")
+_slot_struct = struct.Struct("<I")
+
+_EMPTY = 0xffffffff
+
+
+def _attach_shm(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    # before 3.13, attaching registers the segment with the resource
+    # tracker, which unlinks it when the attaching process exits
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _attach_shared_index(handle):
+    return SharedIndex.attach(handle)
+
+
+class _ItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class SharedIndex(Mapping):
+    """
+    Read-only mapping of file path to metadata tuple, like ``VPK.tree``.
+    Use :meth:`build` or :meth:`attach` to create one.
+
+    ``handle`` is a picklable reference, for :meth:`attach` in other processes
+    """
+    def __init__(self, buf, handle=None, owner=None):
+        self.handle = handle
+        self._owner = owner
+        self._buf = buf
+
+        magic, version, self._count, table_size, encoding = _header_struct.unpack_from(self._buf, 0)
+
+        if magic != MAGIC:
+            raise ValueError("Not a VPK index (invalid magic)")
+        if version != VERSION:
+            raise ValueError("Unsupported VPK index version: %d" % version)
+
+        self.path_enc = encoding.rstrip(b'\x00').decode('ascii') or None
+        self._mask = table_size - 1
+        self._table_offset = _header_struct.size + self._count * _record_struct.size
+
+    def __repr__(self):
+        return "%s(%s, %d files)" % (self.__class__.__name__, repr(self.handle), self._count)
+
+    def __reduce__(self):
+        if self.handle is None:
+            raise TypeError("SharedIndex in anonymous memory can't be pickled, build it with a path")
+        return (_attach_shared_index, (self.handle,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @classmethod
+    def build(cls, items, path_enc='utf-8', path=None):
+        """
+        Builds an index from (file_path, metadata) items. It is written to the
+        file at path, otherwise to a new shared memory segment, or anonymous
+        memory (shared only with forked processes) when those aren't available.
+        """
+        entries = []
+        for file_path, metadata in items:
+            entries.append((file_path.encode(path_enc) if path_enc else file_path, metadata))
+        entries.sort(key=lambda entry: entry[0])
+
+        table_size = 1
+        while table_size < len(entries) * 2:
+            table_size *= 2
+
+        table = array('I', [_EMPTY]) * table_size
+        mask = table_size - 1
+
+        for number, (file_path, _) in enumerate(entries):
+            slot = crc32(file_path) & mask
+            while table[slot] != _EMPTY:
+                slot = (slot + 1) & mask
+            table[slot] = number
+
+        if sys.byteorder == 'big':
+            table.byteswap()
+
+        records = []
+        data = []
+        offset = _header_struct.size + len(entries) * _record_struct.size + table_size * 4
+
+        for file_path, (preload, file_crc32, preload_length, archive_index, archive_offset, file_length) in entries:
+            records.append(_record_struct.pack(offset,
+                                               offset + len(file_path),
+                                               file_crc32,
+                                               archive_offset,
+                                               file_length,
+                                               len(file_path),
+                                               preload_length,
+                                               archive_index,
+                                               ))
+            data.append(file_path)
+            data.append(preload)
+            offset += len(file_path) + len(preload)
+
+        header = _header_struct.pack(MAGIC, VERSION, len(entries), table_size, (path_enc or '').encode('ascii'))
+        data = b''.join([header] + records + [table.tobytes() if hasattr(table, 'tobytes') else table.tostring()] + data)
+
+        if path is not None:
+            with fopen(path, 'wb') as f:
+                f.write(data)
+            return cls.attach(('file', path))
+
+        if shared_memory is not None:
+            shm = shared_memory.SharedMemory(create=True, size=len(data))
+            shm.buf[:len(data)] = data
+            return cls(shm.buf, ('shm', shm.name), shm)
+
+        buf = mmap.mmap(-1, len(data))
+        buf[:] = data
+        return cls(buf, None, buf)
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Returns an index for a handle from another process
+        """
+        kind, name = handle
+
+        if kind == 'shm':
+            shm = _attach_shm(name)
+            return cls(shm.buf, handle, shm)
+        if kind == 'file':
+            with fopen(name, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls(buf, handle, buf)
+
+        raise ValueError("Invalid handle: %s" % repr(handle))
+
+    def close(self):
+        """
+        Detaches from the memory, the index can't be used afterwards
+        """
+        if self._buf is None:
+            return
+
+        self._buf = None
+        self._owner.close()
+
+    def unlink(self):
+        """
+        Closes and removes the shared memory segment or file
+        """
+        self.close()
+
+        if self.handle is not None:
+            kind, name = self.handle
+
+            if kind == 'shm':
+                self._owner.unlink()
+            else:
+                os.remove(name)
+
+    def _record(self, index):
+        return _record_struct.unpack_from(self._buf, _header_struct.size + index * _record_struct.size)
+
+    def _path(self, record):
+        return bytes(self._buf[record[0]:record[0] + record[5]])
+
+    def _metadata(self, record):
+        (_, preload_offset, crc32, archive_offset, file_length, _,
+         preload_length, archive_index) = record
+
+        return (bytes(self._buf[preload_offset:preload_offset + preload_length]),
+                crc32,
+                preload_length,
+                archive_index,
+                archive_offset,
+                file_length,
+                )
+
+    def _find(self, path):
+        """
+        Returns the record for path, or None
+        """
+        if self.path_enc:
+            try:
+                path = path.encode(self.path_enc)
+            except AttributeError:
+                return None
+        elif not isinstance(path, bytes):
+            return None
+
+        slot = crc32(path) & self._mask
+
+        while True:
+            number, = _slot_struct.unpack_from(self._buf, self._table_offset + slot * 4)
+
+            if number == _EMPTY:
+                return None
+
+            record = self._record(number)
+            if self._path(record) == path:
+                return record
+
+            slot = (slot + 1) & self._mask
+
+    def __getitem__(self, path):
+        record = self._find(path)
+
+        if record is None:
+            raise KeyError(path)
+
+        return self._metadata(record)
+
+    def __contains__(self, path):
+        return self._find(path) is not None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for index in range(self._count):
+            path = self._path(self._record(index))
+            yield path.decode(self.path_enc) if self.path_enc else path
+
+    def iter_items(self):
+        """
+        Generator function yielding (file_path, metadata) in path order
+        """
+        for index in range(self._count):
+            record = self._record(index)
+            path = self._path(record)
+            yield path.decode(self.path_enc) if self.path_enc else path, self._metadata(record)
+
+    def items(self):
+        return _ItemsView(self)
@@ -0,0 +1,225 @@
+"""
+Optional instrumentation of file I/O done by :class:`vpk.VPK` and :class:`vpk.VPKFile`
+
+While a :class:`Tracer` is active, files opened by vpk are wrapped to count
+opens, seeks, reads and bytes read per file. Opens are physical: bulk
+operations sharing one handle per archive count one open for it, however
+many entries are read through it. Index parsing time and content cache hits
+are recorded as well. Without an active tracer files are not
+wrapped, so the only cost is a lookup on each open.
+
+.. code:: python
+
+    from vpk.tracing import Tracer, trace
+
+    with trace() as tracer:
+        pak = vpk.open("pak01_dir.vpk")
+        pak["scripts/emoticons.txt"].read()
+
+    print(tracer.stats())
+
+A tracer set with :func:`trace` is scoped to the current context (thread or
+asyncio task, using ``contextvars`` where available). Use :func:`enable` to
+also trace work done in threads started by vpk, e.g. :meth:`vpk.VPK.verify_entries`.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from contextvars import ContextVar
+except ImportError:
+    ContextVar = None
+
+timer = getattr(time, 'perf_counter', time.time)
+
+#: event name to counter name
+EVENTS = {
+    'open': 'opens',
+    'seek': 'seeks',
+    'read': 'reads',
+    'cache_hit': 'cache_hits',
+    'cache_miss': 'cache_misses',
+    'index_parse': 'index_parses',
+}
+
+_context = ContextVar('vpk_tracer', default=None) if ContextVar else None
+_global = None
+
+
+def get_tracer():
+    """
+    Returns the active tracer, or None
+    """
+    if _context is not None:
+        tracer = _context.get()
+        if tracer is not None:
+            return tracer
+    return _global
+
+
+def enable(tracer=None):
+    """
+    Sets a tracer for all threads, returns it
+    """
+    global _global
+    _global = tracer if tracer is not None else Tracer()
+    return _global
+
+
+def disable():
+    global _global
+    _global = None
+
+
+@contextmanager
+def trace(tracer=None):
+    """
+    Context manager activating a tracer for the current context, yields it
+    """
+    tracer = tracer if tracer is not None else Tracer()
+
+    if _context is None:
+        global _global
+        previous, _global = _global, tracer
+        try:
+            yield tracer
+        finally:
+            _global = previous
+        return
+
+    token = _context.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _context.reset(token)
+
+
+def _open(fopen, path, mode='rb'):
+    """
+    Opens path with fopen, traced when there is an active tracer. An fopen
+    with a true ``traced`` attribute traces its own opens, and is called as is.
+    """
+    tracer = get_tracer()
+
+    if tracer is None or getattr(fopen, 'traced', False):
+        return fopen(path, mode)
+    return tracer.open(fopen, path, mode)
+
+
+class Tracer(object):
+    """
+    Collects counters of vpk I/O.
+
+    ``callback(event, path, value)`` is called for every event, where event
+    is one of :data:`EVENTS`, path is the file name (or None) and value is the
+    number of bytes for ``read``, seconds for ``index_parse``, otherwise 1.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.counters)
+
+    def reset(self):
+        self.counters = dict((name, 0) for name in EVENTS.values())
+        self.counters['bytes_read'] = 0
+        self.counters['index_parse_seconds'] = 0.0
+        self.files = {}
+
+    def record(self, event, path=None, value=1):
+        with self._lock:
+            self.counters[EVENTS[event]] += 1
+
+            if event == 'read':
+                self.counters['bytes_read'] += value
+            elif event == 'index_parse':
+                self.counters['index_parse_seconds'] += value
+
+            if path is not None and event in ('open', 'seek', 'read'):
+                counters = self.files.get(path)
+                if counters is None:
+                    counters = self.files[path] = {'opens': 0, 'seeks': 0, 'reads': 0, 'bytes_read': 0}
+                counters[EVENTS[event]] += 1
+                if event == 'read':
+                    counters['bytes_read'] += value
+
+        if self.callback is not None:
+            self.callback(event, path, value)
+
+    def stats(self):
+        """
+        Returns a copy of the counters, with per file counters under ``files``
+        """
+        with self._lock:
+            result = dict(self.counters)
+            result['files'] = dict((path, dict(counters)) for path, counters in self.files.items())
+        return result
+
+    def open(self, fopen, path, mode='rb'):
+        f = fopen(path, mode)
+        self.record('open', path)
+        return TracedFile(f, path, self)
+
+    def time_iter(self, iterable):
+        """
+        Yields from iterable, recording the time spent in it as ``index_parse``
+        """
+        elapsed = 0.0
+        start = timer()
+
+        for item in iterable:
+            elapsed += timer() - start
+            yield item
+            start = timer()
+
+        elapsed += timer() - start
+        self.record('index_parse', None, elapsed)
+
+
+class TracedFile(object):
+    """
+    Proxy for a file object, recording seeks and reads
+    """
+    def __init__(self, f, path, tracer):
+        self._f = f
+        self._path = path
+        self._tracer = tracer
+
+        # callers check for readinto, so only offer it when the file has it
+        if hasattr(f, 'readinto'):
+            self.readinto = self._readinto
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self._f.close()
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def seek(self, *args):
+        self._tracer.record('seek', self._path)
+        return self._f.seek(*args)
+
+    def read(self, *args):
+        data = self._f.read(*args)
+        self._tracer.record('read', self._path, len(data))
+        return data
+
+    def _readinto(self, b):
+        length = self._f.readinto(b)
+        self._tracer.record('read', self._path, length or 0)
+        return length
+
+    def readline(self, *args):
+        data = self._f.readline(*args)
+        self._tracer.record('read', self._path, len(data))
+        return data